@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Actuators used by the agents to push their signal programs to the simulation.
+"""
+
+from backend import traci
+from sensors import LaneSensor
+
+class Actuator(object):
+    """Pushes the signal programs to TraCI, skipping the pushes that change nothing.
+
+    The last program pushed to each traffic light is kept, so a push of the
+    same program, with the same phases and durations, is not sent again.
+    """
+
+    def __init__(self, sensor=None):
+        """The sensor that reads the running phase, by default polls TraCI. """
+        self.sensor = sensor or LaneSensor()
+
+        """The signature of the last program pushed to each traffic light. {"tls":"signature"} """
+        self.pushed = dict()
+
+        """The program running on each traffic light, as far as known. {"tls":"program id"} """
+        self.active = dict()
+
+        """The number of definitions sent, programs switched and pushes skipped. """
+        self.sent = 0
+        self.switched = 0
+        self.skipped = 0
+
+    def signature(self, program):
+        """The data of the program that is sent to TraCI, except the current phase."""
+        return (program.id, tuple((phase._phaseDef, phase._duration, phase._duration1, phase._duration2)
+                                  for phase in program.phases))
+
+    def push(self, tls_id, program, switch=False):
+        """Pushes the program to the traffic light.
+
+        If switch is True, the traffic light is also switched to the program,
+        when it is not the running one yet.
+        """
+        self.send(tls_id, program, switch)
+
+    def send(self, tls_id, program, switch):
+        """Sends the program to TraCI, keeping the phase that is running in SUMO.
+        """
+        signature = self.signature(program)
+        if self.pushed.get(tls_id) == signature:
+            self.skipped += 1
+            return
+
+        phase_index = self.sensor.phase(tls_id)
+        if program.current_phase_index != phase_index:
+            program.current_phase_index = phase_index
+        traci.trafficlights.setCompleteRedYellowGreenDefinition(tls_id, program.to_sumo())
+        self.pushed[tls_id] = signature
+        self.sent += 1
+
+        if switch and self.active.get(tls_id) != program.id:
+            traci.trafficlights.setProgram(tls_id, program.id)
+            self.switched += 1
+        self.active[tls_id] = program.id
+
+    def flush(self):
+        """Sends the pending pushes, there is none because each push is sent at once.
+        """
+        pass
+
+    def __str__(self):
+        return ("Actuations: sent=%d switched=%d skipped=%d"
+                % (self.sent, self.switched, self.skipped))
+
+class BatchActuator(Actuator):
+    """Keeps the pushes of a step and sends them together at the end of it.
+
+    Only the last push to each traffic light is sent, so a single instance
+    is shared by all agents and flush() is called once per step, after the
+    agents update.
+    """
+
+    def __init__(self, sensor=None):
+        super(BatchActuator, self).__init__(sensor)
+
+        """The pushes waiting for the end of the step. {"tls":("program","switch")} """
+        self.pending = dict()
+
+    def push(self, tls_id, program, switch=False):
+        self.pending[tls_id] = (program, switch)
+
+    def flush(self):
+        """Sends all pending pushes.
+        """
+        for tls_id, (program, switch) in self.pending.items():
+            self.send(tls_id, program, switch)
+        self.pending.clear()
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
-import traci
 from tls_util import Program
-from collections import deque, defaultdict
+from sensors import LaneSensor
+from actuators import Actuator
+from network import TrafficLightMetadata
+from history import StepWindow, RingHistory
+from collections import deque
 from copy import deepcopy
 # TODO: verify the need to change this constant.
 # The size of a default vehicle, used in density calculus.
@@ -18,87 +21,156 @@ class Agent(object):
     # Three cycles plus before to actuate, usually to wait before net occupation
     INITIAL_ACT_DELAY = 3
 
-    def __init__(self, id, memory_window, **kwds):
+    def __init__(self, id, memory_window, sensor=None, actuator=None, metadata=None, **kwds):
 
         """The agent identifier. """
         self.id = id
 
+        """The static data of the traffic light, read from TraCI if not given. """
+        self.metadata = metadata or TrafficLightMetadata.from_traci(self.id)
+
         """The controlled lanes """
         #self.lanes = tuple(filter(lambda x: x.find(':') == -1, traci.trafficlights.getControlledLanes(self.id)))
         # Maybe the lanes will be duplicated, if it occurs represents that the 
-        # lane at traffic lights turns into more than one lane. 
-        self.lanes = tuple(traci.trafficlights.getControlledLanes(self.id))
+        # lane at traffic lights turns into more than one lane. The empty lanes
+        # of the link indexes without links are not observed.
+        self.lanes = tuple(lane_id for lane_id in self.metadata.lanes if lane_id)
+
+        """The length of each controlled lane, it never changes. """
+        self.lane_lengths = self.metadata.lane_lengths
+
+        """The sensor that reads the lanes measures, by default polls TraCI. """
+        self.sensor = sensor or LaneSensor()
+        self.sensor.subscribe(self.lanes)
+        self.sensor.subscribe_traffic_light(self.id)
+
+        """The actuator that pushes the programs, by default sends them at once. """
+        self.actuator = actuator or Actuator(self.sensor)
 
         """The controlled links. """
-        self.links = traci.trafficlights.getControlledLinks(self.id)
+        self.links = self.metadata.links
 
         """The current program that is not yet modified. """
         self.program_current = self.init_program_current()
         self.program_default = deepcopy(self.program_current)
 
-        """Keeps the number of vehicles in time for each lane. {"lane":{"step":"no vehicles"}} """
-        self.stopped_vehicles = defaultdict(dict)
-
-        """Keeps the occupancy of vehicles in time for each lane. {"lane":{"step":"occupancy"}} """
-        self.vehicular_occupancy = defaultdict(dict)
-
-        """Keeps the density of vehicles in time for each lane. {"lane":{"step":"density"}} """
-        self.vehicular_density = defaultdict(dict)
-
         """Keeps a list of 'WINDOW_SIZE' length for the current time steps to evaluate. 
 
         time interval w
+
+        With an aggregated sensor one sample is kept for each action, so the
+        window keeps the actions made in about 'memory_window' steps.
         """
         if memory_window > 1:
+            if self.sensor.aggregated:
+                memory_window = self.actions_window(memory_window)
             self.memory_window = deque(maxlen=memory_window)
         else:
             self.memory_window = deque(maxlen=1)
             print ("Warning: The memory window %d not contained in [1,infinite), so its value has past to 1.\n"
                              % memory_window)
 
+        """The slots of the lanes histories, given to the steps of the memory window. """
+        self.history_window = StepWindow(self.memory_window.maxlen)
+
+        """Keeps the number of vehicles in the memory window for each lane. {"lane":{"step":"no vehicles"}} """
+        self.stopped_vehicles = RingHistory(self.lanes, self.history_window, "l")
+
+        """Keeps the occupancy of vehicles in the memory window for each lane, with its sums
+        and deviations. {"lane":{"step":"occupancy"}} """
+        self.vehicular_occupancy = RingHistory(self.lanes, self.history_window, sums=True, deviations=True)
+
+        """Keeps the density of vehicles in the memory window for each lane. {"lane":{"step":"density"}} """
+        self.vehicular_density = RingHistory(self.lanes, self.history_window)
+
         """ Keeps the initial traffic light cycle time, and after use it to actuate. (/1000 is ms) """
         self.current_cycle_time = round(self.program_current.phase_cycle_time() / 1000)
 
         """ Number of cycle to wait before take an action """
         self.count_to_actuate = self.COUNT_TO_ACTUATE + self.INITIAL_ACT_DELAY
 
+        """ The step of the last update, the steps between updates are elapsed at once """
+        self.last_step = None
+
         #TODO: Need to be corrected because of the multiple heritage
         # Is used to take action control for Learning Ant Agent 
         self.act_hack = False
         #print "Agent created"
 
+    def actions_window(self, steps):
+        """Return the number of actions made in the given number of steps, at least one.
+
+        The agent acts once each COUNT_TO_ACTUATE cycles of its program, the
+        period of the detectors written by detectors.write_detectors.
+        """
+        cycle_time = self.program_current.phase_cycle_time() / 1000.0
+        period = max(1, int(round(cycle_time * self.COUNT_TO_ACTUATE)))
+        return max(1, steps // period)
+
     def update_stopped_vehicles(self, step):
         """Update the stopped vehicles for each lane.
         """
         for lane_id in self.lanes:
-            self.stopped_vehicles[lane_id][step] = traci.lane.getLastStepHaltingNumber(lane_id)
+            self.stopped_vehicles[lane_id][step] = self.sensor.halting_number(lane_id)
 
     def update_vehicular_occupancy(self, step):
         """Update the vehicular occupancy for each lane.
         """
         # http://sumo.sourceforge.net/doc/current/docs/userdoc/Simulation/Output/Lane-_or_Edge-based_Traffic_Measures.html
         for lane_id in self.lanes:
-            self.vehicular_occupancy[lane_id][step] = round(traci.lane.getLastStepOccupancy(lane_id), 6)
+            self.vehicular_occupancy[lane_id][step] = round(self.sensor.occupancy(lane_id), 6)
 
     def update_vehicular_density(self, step):
         """Update the vehicular density for each lane.
         """
         # http://sumo.sourceforge.net/doc/current/docs/userdoc/Simulation/Output/Lane-_or_Edge-based_Traffic_Measures.html
         for lane_id in self.lanes:
-            self.vehicular_density[lane_id][step] = round(traci.lane.getLastStepVehicleNumber(lane_id)/float(traci.lane.getLength(lane_id)/VEHICLE_SIZE), 6)
+            self.vehicular_density[lane_id][step] = round(self.sensor.vehicle_number(lane_id)/float(self.lane_lengths[lane_id]/VEHICLE_SIZE), 6)
 
     def update(self, step):
         """Updates the necessary attributes of this class.
         """
-        self.current_cycle_time -= 1
+        # The agent may be woken only at its next update, see next_update()
+        elapsed = 1 if self.last_step is None else step - self.last_step
+        self.last_step = step
+        self.current_cycle_time -= elapsed
         if self.current_cycle_time <= 0:
             self.current_cycle_time = round(self.program_current.phase_cycle_time() / 1000)
             self.count_to_actuate -= 1
 
-        self.memory_window.append(step)
-        self.update_stopped_vehicles(step)
-        self.update_vehicular_occupancy(step)
-        self.update_vehicular_density(step)
+        if self.is_time_to_sample():
+            self.memory_window.append(step)
+            self.history_window.append(step)
+            self.update_stopped_vehicles(step)
+            self.update_vehicular_occupancy(step)
+            self.update_vehicular_density(step)
+
+    def is_time_to_sample(self):
+        """Verify if the lanes must be sampled at this step.
+
+        The sensor aggregated measures are sampled only when the agent
+        is about to act, otherwise the lanes are sampled at every step.
+        """
+        return not self.sensor.aggregated or self.count_to_actuate <= 0
+
+    def can_sleep(self):
+        """Verify if the agent may skip steps, see next_update().
+
+        Only the agents with an aggregated sensor have steps without work,
+        the others sample the lanes at every step.
+        """
+        return self.sensor.aggregated
+
+    def next_update(self, step):
+        """Returns the next step in which the agent has work, after its update at the given step.
+
+        The agent samples the lanes at every step, except with an aggregated
+        sensor: then it only counts the cycles until it is time to sample and
+        act, so it sleeps until the end of the current cycle.
+        """
+        if self.is_time_to_sample():
+            return step + 1
+        return step + max(1, int(self.current_cycle_time))
 
     def is_time_to_act(self):
         """Verify if is time to act.
@@ -120,10 +192,7 @@ class Agent(object):
     def init_program_current(self):
         """Capture the initial signal program and return it.
         """
-        programs = traci.trafficlights.getCompleteRedYellowGreenDefinition(self.id)
-        current_id = traci.trafficlights.getProgram(self.id)
-        current = next(prog for prog in programs if prog._subID == current_id)
-        program = Program.from_sumo(current, self.lanes)
+        program = Program.from_sumo(self.metadata.program, self.metadata.lanes)
         # Updates the limits of phases time.
         #program.set_phases_duration_limits()
         return program
@@ -132,12 +201,11 @@ class Agent(object):
         """Update the traffic lights in real time at simulation.
         
         Notice that this will occurs only after the current program 
-        terminates its actual time phase.
+        terminates its actual time phase. The actuator keeps the phase
+        running in SUMO and skips the push if nothing has changed.
         """
         #print traci.trafficlights.getNextSwitch(self.id), traci.trafficlights.getPhase(self.id)
-        if program.current_phase_index != traci.trafficlights.getPhase(self.id):
-            program.current_phase_index = traci.trafficlights.getPhase(self.id)
-        traci.trafficlights.setCompleteRedYellowGreenDefinition(self.id, program)
+        self.actuator.push(self.id, program)
 #        else:
 #            print "warning: phase indexes are not equal, the program is not changed: ProgramCurrent="+str(program.current_phase_index)+" SumoCurrent="+str(traci.trafficlights.getPhase(self.id))
 
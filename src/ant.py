@@ -1,14 +1,25 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
-import traci
 from agent import Agent
-from math import sqrt,pow
-from collections import deque, defaultdict
-from copy import deepcopy
+from math import pow
+from collections import deque, OrderedDict
+from array import array
 from random import choice
 import tls_util
 
+class PlanState(object):
+    """A possible plan of an ant agent, with its stimulus, tendency and response threshold.
+    """
+
+    __slots__ = ("plan", "stimulus", "tendency", "threshold")
+
+    def __init__(self, plan, stimulus, tendency, threshold):
+        self.plan = plan
+        self.stimulus = stimulus
+        self.tendency = tendency
+        self.threshold = threshold
+
 class Ant(Agent):
     """An Ant agent, based in a bio-inspired approach of Ant System
     """
@@ -34,88 +45,86 @@ class Ant(Agent):
         """
         self.evaporation_rate = evaporation_rate
         
-        """The response threshold is an indicative of success in a particular action of the ant. 
+        """The initial response threshold of each plan, an indicative of success in a particular action of the ant. 
         
         theta_ij
         """
-        self.response_threshold = []
         self.initial_theta = response_threshold
         
-        """Keeps the pheromone density in time for each lane. {"lane":{"step":"density"}}
+        """The row of each controlled lane in the pheromone density. {"lane":"row"} """
+        self.pheromone_rows = dict((lane_id, row) for row, lane_id in enumerate(set(self.lanes)))
+
+        """Keeps the pheromone density of each lane at the last sampled step, by row.
 
         d_l,t
         """
-        self.pheromone_density = defaultdict(dict)
-        
-        """Keeps the pheromone density accumulated in time for each phase of the program. {"phase_index":{"step sum":"no vehicles"}} """
-        self.pheromone_density_accumulated = defaultdict(dict)
+        self.pheromone_density = array("d", [0]) * len(self.pheromone_rows)
+
+        """The evaporation weight of each position of the memory window, the oldest is 1,
+        the weighted sum of the occupancies of each lane, by row, and the sum of the weights. """
+        self.pheromone_weights = []
+        self.pheromone_numerator = array("d", [0]) * len(self.pheromone_rows)
+        self.pheromone_denominator = 0
+
+        """The number of samples above zero of each lane in the memory window, by row. """
+        self.pheromone_nonzero = array("l", [0]) * len(self.pheromone_rows)
+
+        """The rows of the lanes with green light in each phase, by its green lanes. {"green lanes":"rows"} """
+        self.pheromone_green_rows = dict()
+
+        """Keeps the pheromone density accumulated in time for each phase of the program,
+        and the number of steps accumulated. """
         self.init_pheromone_density_accumulated()
 
-        """Keeps the tendency of the current program to be reused by ant on time. 
-        
-        T__theta_ij(s_j)
-        """
-        self.program_tendency = []
+        """The colony engine that computes the pheromone of this ant, None if it computes its own. """
+        self.colony = None
+
+        """The plans of the traffic light share the phases of its default program. """
+        self.plan_pool = tls_util.PlanPool(self.program_default)
+
+        """The possible plans to an ant agent, with the stimulus, the tendency of the
+        program to be reused by ant on time T__theta_ij(s_j) and the response threshold
+        of each one, in the order they were added. {"plan id":PlanState} """
+        self.plans = OrderedDict()
+
+        """The greatest plan id ever added, the next plans take the following ids. """
+        self.max_plan_id = 0
 
-        """A list of possible plans to an ant agent."""
         # Add the current plan to make it a possible plan
-        self.possible_plans = [[deepcopy(self.program_default), self.DEFAULT_THRESHOLD]] #self.program_current
+        self.add_plan(self.plan_pool.plan(self.program_default))
         # Create the new possible plans
         self.init_possible_plans()
-        # Init the change's plan tendency
-        self.init_program_tendency()
-        # Init the agent's response threshold for each plan
-        self.init_response_threshold(response_threshold)
         #print "Ant agent created"
 
     def get_max_plan_id(self):
-        return max(map(lambda pid: int(pid), [p[0].id for p in self.possible_plans]))
+        return self.max_plan_id
 
     def add_plan(self, plan):
-        self.possible_plans.append([plan, self.DEFAULT_THRESHOLD])
-        self.response_threshold.insert(len(self.possible_plans), self.initial_theta)
-        self.program_tendency.insert(len(self.possible_plans), self.DEFAULT_THRESHOLD)
+        plan_id = int(plan.id)
+        self.plans[plan_id] = PlanState(plan, self.DEFAULT_THRESHOLD, self.DEFAULT_THRESHOLD, self.initial_theta)
+        self.max_plan_id = max(self.max_plan_id, plan_id)
 
     def remove_plan(self, id):
         """ Remove a plan when the memory is overloaded.
         """
-        plan_to_remove = filter(lambda p: p[0].id==id, [p for p in self.possible_plans])
-        if plan_to_remove:
-            index = self.get_plan_index(plan_to_remove[0][0])
-            self.program_tendency.remove(self.program_tendency[index])
-            self.response_threshold.remove(self.response_threshold[index])
-            self.possible_plans.remove(plan_to_remove[0])
-
-    def get_plan_index(self, plan):
-        """Return the plan index in possible plans, that match
-        with the current program.
-        """
-        return [idx for (idx,l) in enumerate(self.possible_plans) if l[0].id == plan.id][-1]
+        self.plans.pop(int(id), None)
 
     @property
-    def current_plan_index(self):
-        """Return the 'first' current plan index in possible plans, that match
-        with the current program.
-        """
-        return [idx for (idx,l) in enumerate(self.possible_plans) if l[0].id == self.program_current.id][-1]
-
-    def init_pheromone_density_accumulated(self):
-        """Initializes the dictionary that keeps the accumulated density of pheromone.
-        """
-        for idx, phase in enumerate(self.program_current.phases):
-                self.pheromone_density_accumulated[idx][0] = 0
+    def current_plan(self):
+        """Return the state of the possible plan that match with the current program.
 
-    def init_program_tendency(self):
-        """Initializes the values of the execution's tendency of determined plan for the agent.
+        Raises an IndexError if the current program is not a possible plan.
         """
-        for idx, l in enumerate(self.possible_plans):
-            self.program_tendency.insert(idx, l[1])
+        try:
+            return self.plans[int(self.program_current.id)]
+        except KeyError:
+            raise IndexError("The program %s is not a possible plan." % self.program_current.id)
 
-    def init_response_threshold(self, response_threshold):
-        """Initializes the values of the response threshold for all possible plans for the agent.
+    def init_pheromone_density_accumulated(self):
+        """Initializes the arrays that keep the accumulated density of pheromone, and its steps.
         """
-        for idx, l in enumerate(self.possible_plans):
-            self.response_threshold.insert(idx, response_threshold)
+        self.pheromone_density_accumulated = array("d", [0]) * len(self.program_current.phases)
+        self.pheromone_accumulated_steps = array("l", [0]) * len(self.program_current.phases)
 
     def init_possible_plans(self):
         """Creates a set of the all possible plans that the ant agent can choose.
@@ -129,8 +138,7 @@ class Ant(Agent):
         green_phases = [(idx, phase) for idx, phase in enumerate(new_program.phases)
                            if phase.has_green]
         # Take the plan time cycle duration
-        cycle_length = sum(phase.duration for phase in new_program.phases
-                       if phase.has_green)
+        cycle_length = new_program.phase_green_time()
 
         # Iterate over all the relevant phases
         for (idx, phase) in green_phases:
@@ -138,10 +146,9 @@ class Ant(Agent):
                                 if ophase.has_green and oidx != idx]
             # and for all time factors
             for factor in self.TIME_CHANGE_FACTORS:
-                # Make a copy of the new program and update it
-                copy_program = deepcopy(new_program)
+                # Take the working copy of the new program and update it
+                copy_program = self.plan_pool.edit()
                 program_id += 1
-                copy_program.id = str(program_id)
 
                 # Calculate the time increment for selected phase
                 increment = 0
@@ -154,9 +161,7 @@ class Ant(Agent):
                 copy_program.phases[idx].duration += increment
 
                 # Compensate errors in time cycle
-                phases_duration = [phase.duration for phase in new_program.phases
-                                   if phase.has_green]
-                error = cycle_length - sum(phases_duration)
+                error = cycle_length - new_program.phase_green_time()
 
                 ophases_len = len(other_phases)
                 if error > 0:
@@ -174,29 +179,28 @@ class Ant(Agent):
                     else:
                         copy_program.phases[idx].duration += error                
                 # Save the new program
-                self.possible_plans.append([copy_program, self.DEFAULT_THRESHOLD])
+                self.add_plan(self.plan_pool.plan(copy_program, str(program_id)))
 
     def act(self):
         """Choose a new plan based on agent's tendency to changes plans. 
         """
         super(Ant, self).act()
-        current_agent_tendency = self.program_tendency[self.current_plan_index]
-        programs_indexes = [i for (i, l) in enumerate(self.possible_plans) if l[1] >= current_agent_tendency]
-        # If there is any index
+        current_agent_tendency = self.current_plan.tendency
+        programs = [state.plan for state in self.plans.itervalues() if state.stimulus >= current_agent_tendency]
+        # If there is any plan
         data = ["\n"]
-        if programs_indexes:
+        if programs:
             data.append("Acting")
             # Choose at random one of the best possible plans
-            index = choice(programs_indexes)
-            program = self.possible_plans[index][0]
+            program = choice(programs)
             # Keeps the same phase index for traffic light
-            program.current_phase_index = traci.trafficlights.getPhase(self.id) #self.program_current.current_phase_index
-            self.program_current.fill_with(program, self.lanes)
+            program.current_phase_index = self.sensor.phase(self.id) #self.program_current.current_phase_index
+            self.program_current.switch_to(program)
             #self.update_program_current(self.program_current)
             #traci.trafficlights.setProgram(self.id, program.id)
         else:
             data.append("There's no best plan to choose.")
-        data.append("TlsId: %s CurrentPlan %s: "%(self.id, self.current_plan_index))
+        data.append("TlsId: %s CurrentPlan %s: "%(self.id, self.program_current.id))
         #print "\n".join(data)
         print "Ant actuate"
 
@@ -204,8 +208,10 @@ class Ant(Agent):
         """Updates the necessary attributes of this class. And call the action.
         """
         super(Ant, self).update(step)
-        self.update_pheromone_density()
-        self.update_pheromone_density_accumulated()
+        # The pheromone is deposited at each sample of the lanes, by the ant or its colony
+        if self.is_time_to_sample() and self.colony is None:
+            self.update_pheromone_density()
+            self.update_pheromone_density_accumulated()
 
         if self.is_time_to_act():
             self.update_response_threshold()
@@ -216,63 +222,117 @@ class Ant(Agent):
             data = ["\n"]
             #data.append("Step: "+str(step))
             #data.append("CycleTime: "+str(self.current_cycle_time))
-            data.append("Stimuli: "+str([values for (p,values) in self.possible_plans]))
-            data.append("Threshold: "+str(self.response_threshold)) #[self.current_plan_index]
+            data.append("Stimuli: "+str([state.stimulus for state in self.plans.itervalues()]))
+            data.append("Threshold: "+str([state.threshold for state in self.plans.itervalues()])) #[self.current_plan]
             #data.append("ProgramCurId: "+str(self.program_current.id))
             #data.append("ProgramCurrent: "+str(self.program_current))
-            data.append("Tendency: "+str(self.program_tendency))
+            data.append("Tendency: "+str([state.tendency for state in self.plans.itervalues()]))
             #data.append("PheromeDensityAccum: "+str(self.pheromone_density_accumulated))
             #print "\n".join(data)
 
     def update_program_current(self, program):
-        super(Ant, self).update_program_current(program)
-        traci.trafficlights.setProgram(self.id, program.id)
+        """Update the traffic lights, also switching it to the chosen plan.
+        """
+        self.actuator.push(self.id, program, switch=True)
 
     def update_pheromone_density_accumulated(self):
         """Updates the density of pheromone for each phase of the current program.
         """
-        #Takes the value for the last step (deque last element)
-        step = self.memory_window[-1]
         #TODO: maybe not the best choice, but works
         #phase_index = self.program_current.current_phase_index
-        phase_index = traci.trafficlights.getPhase(self.id)
-        # Get the last key for accumulated density
-        accumulated_steps = self.pheromone_density_accumulated[phase_index].keys()[-1]
-        last_density = self.pheromone_density_accumulated[phase_index][accumulated_steps]
+        phase_index = self.sensor.phase(self.id)
+        rows = self.pheromone_green_rows_of(phase_index)
         occupancy = 0
 
-        #Take the lanes that are not in green state and accumulate their occupancy
+        #Take the lanes that are in green state and accumulate their occupancy at the last step
         #for lane_id in set(self.lanes).difference(self.program_current.current_phase.green_lanes):
-        for lane_id in set(self.lanes).intersection(self.program_current.phases[phase_index].green_lanes):
-            occupancy += self.pheromone_density[lane_id][step] #self.vehicular_occupancy[lane_id][step]
+        for row in rows:
+            occupancy += self.pheromone_density[row] #self.vehicular_occupancy[lane_id][step]
 
         #Increases the number of steps and adds the new value of pheromone for the phase
-        self.pheromone_density_accumulated[phase_index][accumulated_steps+1] = last_density + occupancy #round(last_density + occupancy, 6)
+        self.pheromone_density_accumulated[phase_index] += occupancy #round(last_density + occupancy, 6)
+        self.pheromone_accumulated_steps[phase_index] += 1
 
-        #Clear the last position of the dictionary for memory reduction
-        del self.pheromone_density_accumulated[phase_index][accumulated_steps]
+    def pheromone_green_rows_of(self, phase_index):
+        """Return the rows of the lanes with green light in the phase of the current program.
+        """
+        green_lanes = self.program_current.phases[phase_index].green_lanes
+        rows = self.pheromone_green_rows.get(green_lanes)
+        if rows is None:
+            # The lanes are summed in the order of the set, as the density was always summed
+            rows = tuple(self.pheromone_rows[lane_id] for lane_id in set(self.lanes).intersection(green_lanes))
+            self.pheromone_green_rows[green_lanes] = rows
+        return rows
 
     def update_pheromone_density(self):
         """ time need to be the overall time passed, don't need to be passed on function
             [sum t=0_w ( EVAPORATION_RATE ^-t)*(vehicularDensity(t)) ] / [sum t=0_w ( EVAPORATION_RATE ^-t)]
             t timestep 
             w overall time
+
+        The sums are updated with the last sample of each lane: while the window
+        fills, its weight is added; when full, the older samples lose a position,
+        so their sum is multiplied by the evaporation rate, and the dropped
+        sample leaves. At each turn of the window they are recomputed exactly.
+        A lane without samples above zero has a zero sum, not the rounding
+        left by the subtraction, so its density is 0.0 as in the full sum.
         """
+        window = self.history_window
+        position = len(window) - 1
+        if position == len(self.pheromone_weights):
+            self.pheromone_weights.append(1.0 / pow(self.evaporation_rate, position))
+        weight = self.pheromone_weights[position]
+        if window.head == 0:
+            self.refresh_pheromone_sums()
+        elif window.dropped is None:
+            self.pheromone_denominator += weight
+
+        step = self.memory_window[-1]
+        den = self.pheromone_denominator
         for lane_id in set(self.lanes):
-            # Auxiliary variables initialization
-            num = den = 0
-            for w, time_step in enumerate(self.memory_window):
-                evaporation = 1.0 / pow(self.evaporation_rate, w)
-                num += evaporation * self.vehicular_occupancy[lane_id][time_step]
-                den += evaporation
+            row = self.pheromone_rows[lane_id]
+            if window.head != 0:
+                occupancy = self.vehicular_occupancy[lane_id][step]
+                if occupancy:
+                    self.pheromone_nonzero[row] += 1
+                if window.dropped is None:
+                    self.pheromone_numerator[row] += weight * occupancy
+                else:
+                    dropped = self.vehicular_occupancy.dropped_sample(lane_id)
+                    if dropped:
+                        self.pheromone_nonzero[row] -= 1
+                    if self.pheromone_nonzero[row]:
+                        self.pheromone_numerator[row] = (self.evaporation_rate *
+                            (self.pheromone_numerator[row] - dropped) + weight * occupancy)
+                    else:
+                        self.pheromone_numerator[row] = 0.0
 
             try:
-                density = num / den
+                density = self.pheromone_numerator[row] / den
             except ZeroDivisionError:
                 #Maybe, there is no steps in the array
                 density = 0
 
-            self.pheromone_density[lane_id][time_step] = density
+            # The density is kept for the last sampled step
+            self.pheromone_density[row] = density
+
+    def refresh_pheromone_sums(self):
+        """Recomputes the weighted sums of the occupancies in the memory window.
+        """
+        den = 0
+        for w in range(len(self.history_window)):
+            den += self.pheromone_weights[w]
+        self.pheromone_denominator = den
+        for lane_id in set(self.lanes):
+            # Auxiliary variables initialization
+            num = 0
+            nonzero = 0
+            for w, occupancy in enumerate(self.vehicular_occupancy.window(lane_id)):
+                num += self.pheromone_weights[w] * occupancy
+                if occupancy:
+                    nonzero += 1
+            self.pheromone_numerator[self.pheromone_rows[lane_id]] = num
+            self.pheromone_nonzero[self.pheromone_rows[lane_id]] = nonzero
 
     def program_current_stimulus(self):
         """Stimulus associated to the prioritized semaphore plan
@@ -286,18 +346,21 @@ class Ant(Agent):
             
         stimulus s_j
         """
-        stimulus = 0    #For plan j
-        for idx, phase in enumerate(self.program_current.phases):
-            max_steps = max(self.pheromone_density_accumulated[idx].keys())
-            try:
-                density = float(self.pheromone_density_accumulated[idx][max_steps])/max_steps
-            except ZeroDivisionError:
-                density = 0
-            stimulus += density * self.program_current.phase_time_portion(idx)
+        if self.colony is not None:
+            stimulus = self.colony.stimulus(self)
+        else:
+            stimulus = 0    #For plan j
+            for idx, phase in enumerate(self.program_current.phases):
+                max_steps = self.pheromone_accumulated_steps[idx]
+                try:
+                    density = float(self.pheromone_density_accumulated[idx])/max_steps
+                except ZeroDivisionError:
+                    density = 0
+                stimulus += density * self.program_current.phase_time_portion(idx)
 
         # Updates the current stimulus's plan.
         try:
-            self.possible_plans[self.current_plan_index][1] = stimulus
+            self.current_plan.stimulus = stimulus
         except IndexError as message:
             print "Warning: There is no current plan for ant agent."
             print "\nMessage:", message
@@ -314,16 +377,12 @@ class Ant(Agent):
         #tasks = len(self.program_current.current_phase.green_lanes)
         tasks = 2
         stimulus = pow(self.program_current_stimulus(),tasks)
-        tendency = stimulus / float(stimulus + pow(self.response_threshold[self.current_plan_index],tasks))
-
-        try:
-            self.program_tendency[self.current_plan_index] = round(tendency, 6)
-            #self.program_tendency[self.current_plan_index] = tendency
-        except IndexError as message:
-            print "Warning: There is no current plan for ant agent."
-            print "\nMessage:", message
+        plan = self.current_plan
+        tendency = stimulus / float(stimulus + pow(plan.threshold,tasks))
+        plan.tendency = round(tendency, 6)
+        #plan.tendency = tendency
         data = ["\n"]
-        data.append("Index: "+str(self.current_plan_index))
+        data.append("Plan: "+str(self.program_current.id))
         #data.append("Tasks: "+str(tasks))
         data.append("Stimulus: "+str(stimulus))
         data.append("Tendency: "+str(tendency))
@@ -341,34 +400,24 @@ class Ant(Agent):
         #response = delta * len(self.memory_window)
         #response = delta * current_cycle_time
         response = delta * (current_cycle_time/self.memory_window[-1])
-        self.response_threshold[self.current_plan_index] -= response
+        self.current_plan.threshold -= response
         data = ["\n"]
         data.append("Deviation: "+str(deviation))
         data.append("Delta: "+str(delta))
         data.append("CurCycleTime: "+str(current_cycle_time))
         data.append("Response: "+str(response))
-        data.append("ActualResponse: "+str(self.response_threshold[self.current_plan_index]))
+        data.append("ActualResponse: "+str(self.current_plan.threshold))
         #print " # ".join(data)
         
         
     def deviation(self):
         """Sample standard deviation for pheromone trail accumulated in controlled lane is calculated.
             Then return the average for all deviation calculated.
+
+            The deviations are kept by the occupancy history as its samples enter
+            and leave the memory window, see RingHistory.window_deviation().
         """
-        deviation = []
-        for lane_id in set(self.lanes):
-            deviation_aux = 0
-            lane_occupancy = [self.vehicular_occupancy[lane_id][step] for step in self.memory_window]
-            average = self.average(lane_occupancy)
-            for occupancy in lane_occupancy:
-                deviation_aux += pow(occupancy-average, 2)
-            try:
-                #The -1 is if has only one element, then the average is zero 
-                deviation_aux = sqrt(float(deviation_aux)/float(len(lane_occupancy)-1))
-            except ZeroDivisionError:
-                #Exists only one element
-                deviation_aux = 0
-            deviation.append(deviation_aux)
+        deviation = [self.vehicular_occupancy.window_deviation(lane_id) for lane_id in set(self.lanes)]
 
         #Returns the average of the standard deviations
         return self.average(deviation)
@@ -377,18 +426,22 @@ class Ant(Agent):
         data = [super(Ant, self).__repr__()]
         data.append("\nAnt Class")
         data.append("evaporation rate="+str(self.evaporation_rate))
-        data.append("response threshold="+str(self.response_threshold))
-        data.append("pheromone density="+str(self.pheromone_density))
-        data.append("pheromone density accumulated="+str(self.pheromone_density_accumulated))
-        data.append("program tendency="+str(self.program_tendency))
+        data.append("response threshold="+str([state.threshold for state in self.plans.itervalues()]))
+        data.append("pheromone density="+str(dict((lane_id, self.pheromone_density[row])
+                                                  for lane_id, row in self.pheromone_rows.items())))
+        data.append("pheromone density accumulated="+str(zip(self.pheromone_density_accumulated,
+                                                             self.pheromone_accumulated_steps)))
+        data.append("program tendency="+str([state.tendency for state in self.plans.itervalues()]))
         return "\n".join(data)
 
     def __str__(self):
         data = [super(Ant, self).__str__()]
         data.append("\nAnt Class")
         data.append("evaporation rate="+str(self.evaporation_rate))
-        data.append("response threshold="+str(self.response_threshold))
-        data.append("pheromone density="+str(self.pheromone_density))
-        data.append("pheromone density accumulated="+str(self.pheromone_density_accumulated))
-        data.append("program tendency="+str(self.program_tendency))
+        data.append("response threshold="+str([state.threshold for state in self.plans.itervalues()]))
+        data.append("pheromone density="+str(dict((lane_id, self.pheromone_density[row])
+                                                  for lane_id, row in self.pheromone_rows.items())))
+        data.append("pheromone density accumulated="+str(zip(self.pheromone_density_accumulated,
+                                                             self.pheromone_accumulated_steps)))
+        data.append("program tendency="+str([state.tendency for state in self.plans.itervalues()]))
         return "\n".join(data)
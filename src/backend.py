@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Backends that run the TraCI calls of the controller: the TraCI socket client,
+libsumo running SUMO inside this process, or a pure Python fake network.
+
+The modules of the controller import the traci object of this module, instead
+of the traci package, and the backend is selected once, before the first call.
+Each thread may select its own backend, to drive a simulation of its own.
+"""
+
+import threading
+
+# Export the backend classes
+__all__ = ['traci', 'constants', 'Logic', 'Phase', 'BACKENDS', 'select_backend']
+
+"""The names of the available backends, the first is the default one. """
+BACKENDS = ("traci", "libsumo", "fake")
+
+"""The thread that imports the controller modules. """
+MAIN_THREAD = threading.current_thread()
+
+class constants(object):
+    """The TraCI variable identifiers used by the controller.
+
+    These are protocol values, the same of traci.constants for every backend,
+    so they can be read before a backend is selected.
+    """
+    LAST_STEP_VEHICLE_NUMBER = 0x10
+    LAST_STEP_OCCUPANCY = 0x13
+    LAST_STEP_VEHICLE_HALTING_NUMBER = 0x14
+    TL_CURRENT_PHASE = 0x28
+    TL_CURRENT_PROGRAM = 0x29
+    TL_NEXT_SWITCH = 0x2d
+
+class Logic(object):
+    """A signal program, with the same attributes of traci.trafficlights.Logic.
+
+    The TraCI client reads only these attributes, so it accepts this class
+    and its subclasses, and no backend is needed to create a program.
+    """
+
+    __slots__ = ("_subID", "_type", "_subParameter", "_currentPhaseIndex", "_phases")
+
+    def __init__(self, subID, type, subParameter, currentPhaseIndex, phases):
+        self._subID = subID
+        self._type = type
+        self._subParameter = subParameter
+        self._currentPhaseIndex = currentPhaseIndex
+        self._phases = phases
+
+    def __repr__(self):
+        return ("Logic:\nsubID: %s\ntype: %s\nsubParameter: %s\ncurrentPhaseIndex: %s\nphases: %s"
+                % (self._subID, self._type, self._subParameter, self._currentPhaseIndex, self._phases))
+
+class Phase(object):
+    """A phase of a signal program, with the same attributes of traci.trafficlights.Phase.
+
+    The durations are in milliseconds.
+    """
+
+    __slots__ = ("_duration", "_duration1", "_duration2", "_phaseDef")
+
+    def __init__(self, duration, duration1, duration2, phaseDef):
+        self._duration = duration
+        self._duration1 = duration1
+        self._duration2 = duration2
+        self._phaseDef = phaseDef
+
+    def __repr__(self):
+        return ("Phase:\nduration: %s\nduration1: %s\nduration2: %s\nphaseDef: %s\n"
+                % (self._duration, self._duration1, self._duration2, self._phaseDef))
+
+class Backend(object):
+    """Forwards the TraCI calls to the selected implementation.
+
+    The implementation selected by the main thread receives the calls of
+    all threads, except the ones that selected their own. If no
+    implementation is selected before the first call, the TraCI socket
+    client is used.
+    """
+
+    def __init__(self):
+        """The implementation selected by the main thread, a module or an object with the TraCI API. """
+        self.module = None
+
+        """The implementation selected by each thread. """
+        self.local = threading.local()
+
+    def select(self, module):
+        """Makes the given implementation receive the calls of the current thread."""
+        self.local.module = module
+        if threading.current_thread() is MAIN_THREAD:
+            self.module = module
+
+    def selected(self):
+        """Returns the implementation that receives the calls, the default one if none is selected yet."""
+        module = getattr(self.local, "module", None) or self.module
+        if module is None:
+            module = load_backend(BACKENDS[0])
+            self.select(module)
+        return module
+
+    def __getattr__(self, name):
+        if name in ("module", "local"):
+            raise AttributeError(name)
+        return getattr(self.selected(), name)
+
+class LibsumoTrafficLights(object):
+    """The traffic lights domain of libsumo, as seen from the TraCI client.
+
+    libsumo gives the times in seconds and the programs as TraCILogic, here
+    they are converted to milliseconds and Logic, as the controller expects.
+    """
+
+    def __init__(self, module):
+        """The libsumo module. """
+        self.module = module
+        self.domain = module.trafficlight
+
+        self.getIDList = self.domain.getIDList
+        self.getControlledLanes = self.domain.getControlledLanes
+        self.getControlledLinks = self.domain.getControlledLinks
+        self.getProgram = self.domain.getProgram
+        self.getPhase = self.domain.getPhase
+        self.setProgram = self.domain.setProgram
+        self.subscribe = self.domain.subscribe
+
+    def getNextSwitch(self, tls_id):
+        return to_milliseconds(self.domain.getNextSwitch(tls_id))
+
+    def getSubscriptionResults(self, tls_id):
+        results = dict(self.domain.getSubscriptionResults(tls_id))
+        if constants.TL_NEXT_SWITCH in results:
+            results[constants.TL_NEXT_SWITCH] = to_milliseconds(results[constants.TL_NEXT_SWITCH])
+        return results
+
+    def getCompleteRedYellowGreenDefinition(self, tls_id):
+        return [Logic(logic.programID, logic.type, 0, logic.currentPhaseIndex,
+                      [Phase(to_milliseconds(phase.duration), to_milliseconds(phase.minDur),
+                             to_milliseconds(phase.maxDur), phase.state)
+                       for phase in logic.phases])
+                for logic in self.domain.getCompleteRedYellowGreenDefinition(tls_id)]
+
+    def setCompleteRedYellowGreenDefinition(self, tls_id, tls):
+        phases = [self.module.TraCIPhase(phase._duration / 1000.0, phase._phaseDef,
+                                         phase._duration1 / 1000.0, phase._duration2 / 1000.0)
+                  for phase in tls._phases]
+        self.domain.setCompleteRedYellowGreenDefinition(tls_id,
+            self.module.TraCILogic(tls._subID, tls._type, tls._currentPhaseIndex, phases))
+
+class LibsumoBackend(object):
+    """Runs SUMO inside this process through libsumo, with the API of the TraCI client.
+
+    There is no socket, so each call costs a function call instead of a
+    round trip. SUMO is started by init() with the given configuration file.
+    """
+
+    def __init__(self, module, config_file, binary="sumo"):
+        """The libsumo module and the SUMO command line. """
+        self.module = module
+        self.command = [binary, "-c", config_file]
+
+        self.lane = module.lane
+        self.lanearea = module.lanearea
+        self.simulation = module.simulation
+        self.trafficlights = LibsumoTrafficLights(module)
+        self.FatalTraCIError = module.TraCIException
+
+    def init(self, port=None):
+        """Starts SUMO, the port is not used."""
+        self.module.start(self.command)
+
+    def close(self):
+        self.module.close()
+
+    def simulationStep(self, step=0):
+        """Runs the simulation until the given time in milliseconds, or one step if 0."""
+        self.module.simulationStep(step / 1000.0)
+
+class TraciConnection(object):
+    """A connection of its own of the TraCI socket client, opened when created.
+
+    The module functions of the client share a single connection, so the
+    threads that drive a simulation each use this class, that needs a
+    client with traci.connect().
+    """
+
+    def __init__(self, module, port):
+        """The client module and the connection to SUMO. """
+        self.module = module
+        self.connection = module.connect(port)
+        self.FatalTraCIError = module.FatalTraCIError
+
+    def init(self, port=None):
+        """The connection is already open."""
+        pass
+
+    def __getattr__(self, name):
+        if name in ("module", "connection"):
+            raise AttributeError(name)
+        return getattr(self.connection, name)
+
+def to_milliseconds(seconds):
+    """Converts a time in seconds, as used by libsumo and SUMO files, to milliseconds as used by TraCI."""
+    return int(round(float(seconds) * 1000))
+
+def load_backend(name, config_file=None, port=None):
+    """Imports and returns the implementation of the named backend.
+
+    The libsumo backend needs the SUMO configuration file to start the
+    simulation. If the port is given, the traci backend opens a connection
+    of its own to it. Raises an ImportError if the backend is not installed.
+    """
+    if name == "traci":
+        import traci as module
+        if port is not None:
+            if not hasattr(module, "connect"):
+                raise ImportError("The TraCI client has no connect(), it can not open many connections.")
+            return TraciConnection(module, port)
+        return module
+    elif name == "libsumo":
+        if config_file is None:
+            raise ValueError("The libsumo backend needs the SUMO configuration file.")
+        import libsumo
+        return LibsumoBackend(libsumo, config_file)
+    elif name == "fake":
+        from fake_traci import FakeTraci
+        return FakeTraci()
+    raise ValueError("Unknown backend: %s. Options: %s." % (name, ", ".join(BACKENDS)))
+
+def select_backend(name, config_file=None, port=None):
+    """Selects the backend that receives the TraCI calls of the controller in the current thread."""
+    traci.select(load_backend(name, config_file, port))
+    return traci.selected()
+
+"""The TraCI API used by the controller modules. """
+traci = Backend()
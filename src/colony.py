@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Colony-wide pheromone of the ant agents, computed with NumPy.
+
+The occupancy samples of the lanes of all ants are kept in a single ring
+buffer of window x lanes values, and at each step the pheromone density of
+every lane and the accumulated density of the running phase of every
+traffic light are computed with a few array operations, in the same order
+of the ants own computation, see Ant.update_pheromone_density(). The
+stimulus of the current program of every ant is computed at once, at the
+first read of each step.
+
+NumPy is optional, without it the ants compute their own pheromone.
+"""
+
+from math import pow
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Export the colony engine
+__all__ = ['ColonyEngine']
+
+class ColonyEngine(object):
+    """Computes the pheromone of a colony of ants at each step, before their updates.
+
+    The ants keep their pheromone arrays as views of the colony ones, so they
+    read them as before, but do not compute them. The ants of a colony share
+    the memory window and the evaporation rate, and must sample their lanes
+    at every step, so the aggregated sensors are not supported.
+    """
+
+    def __init__(self, ants, sensor):
+        if numpy is None:
+            raise ImportError("The colony engine requires NumPy.")
+        if sensor.aggregated:
+            raise ValueError("The colony engine requires the lanes sampled at every step, not an aggregated sensor.")
+        if len(set((ant.memory_window.maxlen, ant.evaporation_rate) for ant in ants)) > 1:
+            raise ValueError("The ants of the colony must share the memory window and the evaporation rate.")
+
+        """The sensor read by the ants, and their traffic lights. """
+        self.sensor = sensor
+        self.ants = ants
+        self.ids = [ant.id for ant in ants]
+
+        """The lane of each row, the rows of each ant follow its pheromone rows, and the
+        first phase of each ant in the phases of the colony. """
+        self.lanes = []
+        self.phase_offsets = numpy.zeros(len(ants), dtype=numpy.int64)
+        phases = 0
+        """The green lanes of each phase, as pairs of phase and row, in the order they are summed. """
+        pair_phases = []
+        pair_rows = []
+        for index, ant in enumerate(ants):
+            start = len(self.lanes)
+            self.lanes.extend(sorted(ant.pheromone_rows, key=ant.pheromone_rows.get))
+            self.phase_offsets[index] = phases
+            for phase_index in range(len(ant.program_current.phases)):
+                for row in ant.pheromone_green_rows_of(phase_index):
+                    pair_phases.append(phases + phase_index)
+                    pair_rows.append(start + row)
+            phases += len(ant.program_current.phases)
+        self.pair_phases = numpy.array(pair_phases, dtype=numpy.int64)
+        self.pair_rows = numpy.array(pair_rows, dtype=numpy.int64)
+
+        """The ring buffer of the occupancy samples, a line for each step of the window. """
+        self.size = ants[0].memory_window.maxlen if ants else 1
+        self.evaporation_rate = ants[0].evaporation_rate if ants else 1
+        self.samples = numpy.zeros((self.size, len(self.lanes)))
+        self.head = 0
+        self.count = 0
+
+        """The evaporation weight of each position of the window, the weighted sum of
+        the samples of each row and the sum of the weights. """
+        self.weights = []
+        self.numerator = numpy.zeros(len(self.lanes))
+        self.denominator = 0
+
+        """The number of samples above zero of each row in the window. """
+        self.nonzero = numpy.zeros(len(self.lanes), dtype=numpy.int64)
+
+        """The pheromone density of each row, and the accumulated density and steps of each phase. """
+        self.density = numpy.zeros(len(self.lanes))
+        self.accumulated = numpy.zeros(phases)
+        self.steps = numpy.zeros(phases, dtype=numpy.int64)
+
+        """The ant of each phase, the time portion of each phase in the program of its ant, and
+        the times of each program the portions were taken from, see Program.times(). """
+        self.phase_ants = numpy.repeat(numpy.arange(len(ants)),
+                                       [len(ant.program_current.phases) for ant in ants])
+        self.portions = numpy.zeros(phases)
+        self.times = [None] * len(ants)
+
+        """The stimulus of each ant, valid until the next update, and the index of each ant. """
+        self.stimuli = numpy.zeros(len(ants))
+        self.stimuli_valid = False
+        self.indexes = dict((ant.id, index) for index, ant in enumerate(ants))
+
+        # The ants read their pheromone from the colony
+        start = 0
+        for index, ant in enumerate(ants):
+            end = start + len(ant.pheromone_rows)
+            first = self.phase_offsets[index]
+            last = first + len(ant.program_current.phases)
+            ant.pheromone_density = self.density[start:end]
+            ant.pheromone_density_accumulated = self.accumulated[first:last]
+            ant.pheromone_accumulated_steps = self.steps[first:last]
+            ant.colony = self
+            start = end
+
+    def update(self, step):
+        """Deposits the pheromone of the sampled step, it must be called after the sensor update.
+        """
+        sensor = self.sensor
+        occupancy = numpy.array([round(sensor.occupancy(lane_id), 6) for lane_id in self.lanes])
+
+        position = self.count
+        full = self.count == self.size
+        if not full:
+            self.count += 1
+        else:
+            position -= 1
+        if position == len(self.weights):
+            self.weights.append(1.0 / pow(self.evaporation_rate, position))
+        weight = self.weights[position]
+
+        slot = self.head
+        dropped = self.samples[slot].copy() if full else None
+        self.samples[slot] = occupancy
+        self.head = (self.head + 1) % self.size
+
+        if self.head == 0:
+            # At each turn of the window the sums are recomputed, from the oldest sample
+            den = 0
+            num = numpy.zeros(len(self.lanes))
+            for w in range(self.count):
+                den += self.weights[w]
+                num += self.weights[w] * self.samples[w]
+            self.denominator = den
+            self.numerator = num
+            self.nonzero = numpy.count_nonzero(self.samples[:self.count], axis=0)
+        elif not full:
+            self.denominator += weight
+            self.numerator += weight * occupancy
+            self.nonzero += occupancy != 0
+        else:
+            self.numerator = self.evaporation_rate * (self.numerator - dropped) + weight * occupancy
+            self.nonzero += (occupancy != 0).astype(numpy.int64) - (dropped != 0)
+            # The rows without samples above zero have a zero sum, as in the ants
+            self.numerator[self.nonzero == 0] = 0.0
+        numpy.divide(self.numerator, self.denominator, out=self.density)
+
+        # The green lanes of the running phase of each traffic light accumulate their density
+        phases = numpy.array([sensor.phase(tls_id) for tls_id in self.ids], dtype=numpy.int64) + self.phase_offsets
+        sums = numpy.bincount(self.pair_phases, weights=self.density[self.pair_rows],
+                              minlength=len(self.accumulated))
+        self.accumulated[phases] += sums[phases]
+        self.steps[phases] += 1
+        self.stimuli_valid = False
+
+    def stimulus(self, ant):
+        """The stimulus of the current program of the ant, see Ant.program_current_stimulus().
+        """
+        index = self.indexes[ant.id]
+        # The ant may have switched its program since the stimuli were computed
+        if not self.stimuli_valid or ant.program_current.times() is not self.times[index]:
+            self.update_stimuli()
+        return float(self.stimuli[index])
+
+    def update_stimuli(self):
+        """Computes the stimulus of the current program of every ant.
+
+        The portions of an ant are taken again only when the times of its
+        program changed. bincount adds the terms of each ant one by one, in
+        the order of its phases, as the ant does.
+        """
+        for index, ant in enumerate(self.ants):
+            times = ant.program_current.times()
+            if times is not self.times[index]:
+                first = self.phase_offsets[index]
+                self.portions[first:first + len(times[2])] = times[2]
+                self.times[index] = times
+        steps = self.steps
+        density = numpy.where(steps > 0, self.accumulated / numpy.maximum(steps, 1), 0)
+        self.stimuli = numpy.bincount(self.phase_ants, weights=density * self.portions,
+                                      minlength=len(self.ants))
+        self.stimuli_valid = True
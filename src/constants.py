@@ -17,6 +17,82 @@ PORT = "--port"
 MIN_PORT = "-p"
 DEFAULT_PORT = 8813
 
+# The simulation ends after the steps limit, or when all vehicles have arrived after the flow steps.
+STEPS_LIMIT = 36000
+FLOW_STEPS = 3600
+
+SUBSCRIPTION = "--subscription"
+MIN_SUBSCRIPTION = "-sub"
+DEFAULT_SUBSCRIPTION = False
+
+DETECTORS = "--detectors"
+MIN_DETECTORS = "-det"
+DEFAULT_DETECTORS = False
+
+WRITE_DETECTORS = "--write-detectors"
+MIN_WRITE_DETECTORS = "-wd"
+DEFAULT_WRITE_DETECTORS = None
+
+NET_FILE = "--net-file"
+MIN_NET_FILE = "-n"
+DEFAULT_NET_FILE = None
+
+METADATA_CACHE = "--metadata-cache"
+MIN_METADATA_CACHE = "-mc"
+DEFAULT_METADATA_CACHE = "metadata-cache"
+
+BACKEND = "--backend"
+MIN_BACKEND = "-be"
+DEFAULT_BACKEND = "traci"
+
+SUMO_CONFIG = "--sumo-config"
+MIN_SUMO_CONFIG = "-sc"
+DEFAULT_SUMO_CONFIG = None
+
+RECORD = "--record"
+MIN_RECORD = "-rec"
+DEFAULT_RECORD = None
+
+REPLAY = "--replay"
+MIN_REPLAY = "-rep"
+DEFAULT_REPLAY = None
+
+SEED = "--seed"
+MIN_SEED = "-sd"
+DEFAULT_SEED = None
+
+OUTPUT_DIR = "--output-dir"
+MIN_OUTPUT_DIR = "-od"
+DEFAULT_OUTPUT_DIR = "."
+
+SWEEP = "--sweep"
+MIN_SWEEP = "-sw"
+DEFAULT_SWEEP = None
+
+SWEEP_THREADS = "--sweep-threads"
+MIN_SWEEP_THREADS = "-swt"
+DEFAULT_SWEEP_THREADS = 0
+
+PARTITIONS = "--partitions"
+MIN_PARTITIONS = "-pt"
+DEFAULT_PARTITIONS = 1
+
+PIPELINE_LAG = "--pipeline-lag"
+MIN_PIPELINE_LAG = "-pl"
+DEFAULT_PIPELINE_LAG = 0
+
+DECISION_LOG = "--decision-log"
+MIN_DECISION_LOG = "-dl"
+DEFAULT_DECISION_LOG = None
+
+COMPARE_DECISIONS = "--compare-decisions"
+MIN_COMPARE_DECISIONS = "-cmp"
+DEFAULT_COMPARE_DECISIONS = None
+
+TRACI_PROFILE = "--traci-profile"
+MIN_TRACI_PROFILE = "-tp"
+DEFAULT_TRACI_PROFILE = None
+
 #
 # Swarm configuration
 #
@@ -32,6 +108,10 @@ DEFAULT_RESPONSE_THRESHOLD = 0.5
 THETA = "--theta" # same as response threshold
 MIN_THETA = "-t"
 
+COLONY_ENGINE = "--colony-engine"
+MIN_COLONY_ENGINE = "-ce"
+DEFAULT_COLONY_ENGINE = False
+
 #
 # Learning configuration
 #
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Placement of the lane-area(E2) detectors used by the detectors sensing mode.
+"""
+
+from xml.sax.saxutils import quoteattr
+
+"""The prefix of the detectors identifiers. """
+DETECTOR_PREFIX = "swarm_e2_"
+
+"""SUMO discards the output written to this file name. """
+DETECTOR_OUTPUT = "NUL"
+
+def write_detectors(metadata, path, cycles):
+    """Writes a SUMO additional file with one lane-area detector covering each controlled lane.
+
+    The detectors period is the time of the given number of cycles of the
+    default program of the traffic light, so SUMO aggregates the measures
+    over about the time between two actions of the agent. The file must be
+    given to SUMO at launch, e.g. sumo -a path.
+    """
+    lanes = set()
+    with open(path, "w+") as f:
+        f.write("<additional>\n")
+        for tls in metadata.traffic_lights:
+            cycle_time = sum(phase._duration for phase in tls.program._phases) / 1000.0
+            period = max(1, int(round(cycle_time * cycles)))
+            for lane_id in sorted(set(tls.lane_lengths).difference(lanes)):
+                f.write('    <e2Detector id=%s lane=%s pos="0" length="%.2f" freq="%d" file="%s" friendlyPos="true"/>\n'
+                        % (quoteattr(DETECTOR_PREFIX + lane_id), quoteattr(lane_id),
+                           tls.lane_lengths[lane_id], period, DETECTOR_OUTPUT))
+                lanes.add(lane_id)
+        f.write("</additional>\n")
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""A pure Python network with the TraCI API used by the controller.
+
+It runs the agents, the sensors and the actuators without SUMO, e.g. to
+check the backend switch or to measure the controller overhead alone.
+"""
+
+import threading
+from random import Random
+from multiprocessing.managers import BaseManager
+from backend import constants, Logic, Phase
+
+# Export the fake classes
+__all__ = ['FakeTraci', 'FakeServer', 'FakeClient', 'FakeManager', 'FatalTraCIError']
+
+class FatalTraCIError(Exception):
+    """Raised on a call after the fake simulation is closed."""
+    pass
+
+class FakeNetwork(object):
+    """A set of isolated junctions, each one with four one-lane approaches.
+
+    Each approach is controlled by two links of a traffic light, that runs a
+    two-phase program with yellow phases. Vehicles arrive at random until the
+    demand ends, wait on the approach and leave it one per step while green.
+    """
+
+    """The approaches of each junction, a lane of each one. """
+    APPROACHES = "NSEW"
+
+    """The signals of each phase, for the links in the lanes order. """
+    STATES = ("GGGGrrrr", "yyyyrrrr", "rrrrGGGG", "rrrryyyy")
+
+    """The duration of the green and yellow phases, in milliseconds. """
+    GREEN_DURATION = 31000
+    YELLOW_DURATION = 4000
+
+    """The length of a vehicle plus the gap in the queue, in meters. """
+    VEHICLE_SPACE = 7.5
+
+    def __init__(self, size=3, seed=1, arrival_rate=0.15, demand_end=3600000):
+        """The random source of the arrivals. """
+        self.random = Random(seed)
+
+        """The probability of an arrival on each lane per step, until demand_end ms. """
+        self.arrival_rate = arrival_rate
+        self.demand_end = demand_end
+
+        """The simulation time in milliseconds. """
+        self.time = 0
+
+        """The queue and length of each lane. {"lane":"value"} """
+        self.queues = dict()
+        self.lengths = dict()
+
+        """The vehicles departed and arrived at the last step. """
+        self.departed = 0
+        self.arrived = 0
+
+        """The controlled lanes, programs and state of each traffic light. {"tls":{"key":"value"}} """
+        self.traffic_lights = dict()
+        for index in range(size):
+            lanes = []
+            for approach in self.APPROACHES:
+                lane_id = "%s%d_0" % (approach, index)
+                lanes += [lane_id, lane_id]
+                self.queues[lane_id] = 0
+                self.lengths[lane_id] = 100.0 + 10 * index
+            phases = [Phase(duration, duration, duration, state)
+                      for duration, state in zip((self.GREEN_DURATION, self.YELLOW_DURATION) * 2, self.STATES)]
+            self.traffic_lights["tl%d" % index] = dict(lanes=tuple(lanes), programs={"0": Logic("0", 0, 0, 0, phases)},
+                                                       program="0", phase=0, switch=self.GREEN_DURATION)
+
+    def step(self):
+        """Advances the simulation by one second."""
+        self.time += 1000
+        self.departed = self.arrived = 0
+        for tls_id in sorted(self.traffic_lights):
+            tls = self.traffic_lights[tls_id]
+            phases = tls["programs"][tls["program"]]._phases
+            if self.time >= tls["switch"]:
+                tls["phase"] = (tls["phase"] + 1) % len(phases)
+                tls["switch"] = self.time + phases[tls["phase"]]._duration
+            state = phases[tls["phase"]]._phaseDef
+            # Each lane is controlled by a pair of links, the first one is enough
+            for index in range(0, len(tls["lanes"]), 2):
+                lane_id = tls["lanes"][index]
+                if self.time <= self.demand_end and self.random.random() < self.arrival_rate:
+                    self.queues[lane_id] += 1
+                    self.departed += 1
+                if state[index] in "gG" and self.queues[lane_id] > 0:
+                    self.queues[lane_id] -= 1
+                    self.arrived += 1
+
+    def occupancy(self, lane_id):
+        """The fraction of the lane taken by the queue."""
+        return min(1.0, self.queues[lane_id] * self.VEHICLE_SPACE / self.lengths[lane_id])
+
+class Subscriptions(object):
+    """Keeps the subscribed variables of a domain and their values at the last step.
+    """
+
+    """The domain function that reads each variable. {"variable":"function"} """
+    READERS = {}
+
+    def __init__(self):
+        """The subscribed variables and their values. {"object":{"variable":"value"}} """
+        self.variables = dict()
+        self.results = dict()
+
+    def subscribe(self, object_id, variables):
+        self.variables[object_id] = tuple(variables)
+        self.update_object(object_id)
+
+    def getSubscriptionResults(self, object_id):
+        return self.results.get(object_id)
+
+    def update(self):
+        """Reads the values of all subscribed objects."""
+        for object_id in self.variables:
+            self.update_object(object_id)
+
+    def update_object(self, object_id):
+        self.results[object_id] = dict((variable, self.read(object_id, variable))
+                                       for variable in self.variables[object_id])
+
+    def read(self, object_id, variable):
+        """Reads the variable of the object, bypassing the domain functions,
+        so a subscription is not accounted as a call."""
+        return self.READERS[variable](self, object_id)
+
+class LaneDomain(Subscriptions):
+    """The lane domain of the fake network."""
+
+    def __init__(self, network):
+        super(LaneDomain, self).__init__()
+        self.network = network
+
+    def getLastStepHaltingNumber(self, lane_id):
+        return self.network.queues[lane_id]
+
+    def getLastStepOccupancy(self, lane_id):
+        return self.network.occupancy(lane_id)
+
+    def getLastStepVehicleNumber(self, lane_id):
+        return self.network.queues[lane_id]
+
+    def getLength(self, lane_id):
+        return self.network.lengths[lane_id]
+
+    READERS = {constants.LAST_STEP_VEHICLE_HALTING_NUMBER: getLastStepHaltingNumber,
+               constants.LAST_STEP_OCCUPANCY: getLastStepOccupancy,
+               constants.LAST_STEP_VEHICLE_NUMBER: getLastStepVehicleNumber}
+
+class TrafficLightsDomain(Subscriptions):
+    """The traffic lights domain of the fake network."""
+
+    def __init__(self, network):
+        super(TrafficLightsDomain, self).__init__()
+        self.network = network
+
+    def getIDList(self):
+        return sorted(self.network.traffic_lights)
+
+    def getControlledLanes(self, tls_id):
+        return list(self.network.traffic_lights[tls_id]["lanes"])
+
+    def getControlledLinks(self, tls_id):
+        return [[(lane_id, lane_id.replace("_0", "_out"), "")]
+                for lane_id in self.network.traffic_lights[tls_id]["lanes"]]
+
+    def getCompleteRedYellowGreenDefinition(self, tls_id):
+        return [Logic(logic._subID, logic._type, logic._subParameter, logic._currentPhaseIndex,
+                      [Phase(phase._duration, phase._duration1, phase._duration2, phase._phaseDef)
+                       for phase in logic._phases])
+                for logic in self.network.traffic_lights[tls_id]["programs"].values()]
+
+    def getProgram(self, tls_id):
+        return self.network.traffic_lights[tls_id]["program"]
+
+    def getPhase(self, tls_id):
+        return self.network.traffic_lights[tls_id]["phase"]
+
+    def getNextSwitch(self, tls_id):
+        return self.network.traffic_lights[tls_id]["switch"]
+
+    def setCompleteRedYellowGreenDefinition(self, tls_id, tls):
+        """Keeps a copy of the program and, as SUMO does, starts running it at its current phase."""
+        phases = [Phase(phase._duration, phase._duration1, phase._duration2, phase._phaseDef)
+                  for phase in tls._phases]
+        traffic_light = self.network.traffic_lights[tls_id]
+        traffic_light["programs"][str(tls._subID)] = Logic(str(tls._subID), tls._type, tls._subParameter,
+                                                           tls._currentPhaseIndex, phases)
+        traffic_light["program"] = str(tls._subID)
+        traffic_light["phase"] = tls._currentPhaseIndex
+        traffic_light["switch"] = self.network.time + phases[tls._currentPhaseIndex]._duration
+
+    def setProgram(self, tls_id, program_id):
+        traffic_light = self.network.traffic_lights[tls_id]
+        if str(program_id) != traffic_light["program"]:
+            traffic_light["program"] = str(program_id)
+            traffic_light["phase"] = 0
+
+    READERS = {constants.TL_CURRENT_PHASE: getPhase,
+               constants.TL_CURRENT_PROGRAM: getProgram,
+               constants.TL_NEXT_SWITCH: getNextSwitch}
+
+class LaneAreaDomain(object):
+    """The lane-area(E2) detectors domain of the fake network, one detector covers each lane."""
+
+    """The prefix of the detectors identifiers, as written by detectors.write_detectors. """
+    PREFIX = "swarm_e2_"
+
+    def __init__(self, network):
+        self.network = network
+
+    def getIDList(self):
+        return [self.PREFIX + lane_id for lane_id in sorted(self.network.queues)]
+
+    def getLaneID(self, detector_id):
+        return detector_id[len(self.PREFIX):]
+
+    def getLastStepHaltingNumber(self, detector_id):
+        return self.network.queues[self.getLaneID(detector_id)]
+
+    def getLastIntervalOccupancy(self, detector_id):
+        """The occupancy at the last step, in percent."""
+        return 100.0 * self.network.occupancy(self.getLaneID(detector_id))
+
+    def getLastStepVehicleNumber(self, detector_id):
+        return self.network.queues[self.getLaneID(detector_id)]
+
+class SimulationDomain(object):
+    """The simulation domain of the fake network."""
+
+    def __init__(self, network):
+        self.network = network
+
+    def getDepartedNumber(self):
+        return self.network.departed
+
+    def getArrivedNumber(self):
+        return self.network.arrived
+
+class FakeTraci(object):
+    """The fake network with the TraCI API: the domains and the simulation control.
+    """
+
+    FatalTraCIError = FatalTraCIError
+    constants = constants
+
+    def __init__(self, size=3, seed=1):
+        """The simulated network and its TraCI domains. """
+        self.network = FakeNetwork(size, seed)
+        self.lane = LaneDomain(self.network)
+        self.trafficlights = TrafficLightsDomain(self.network)
+        self.lanearea = LaneAreaDomain(self.network)
+        self.simulation = SimulationDomain(self.network)
+
+        """True after the simulation is closed. """
+        self.closed = False
+
+    def init(self, port=None):
+        """There is nothing to connect to, the port is not used."""
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def simulationStep(self, step=0):
+        """Runs one step of one second, the target time is not supported."""
+        if self.closed:
+            raise FatalTraCIError("The fake simulation is closed.")
+        self.network.step()
+        self.lane.update()
+        self.trafficlights.update()
+
+class FakeServer(object):
+    """A fake network shared by many clients, as SUMO with many TraCI clients.
+
+    The network steps only when all clients asked for the step, so the
+    clients run in lock step. A closed client is not waited anymore. It is
+    served to other processes by a FakeManager.
+    """
+
+    def __init__(self, clients, size=3, seed=1):
+        """The shared network and the number of clients not closed. """
+        self.traci = FakeTraci(size, seed)
+        self.clients = clients
+
+        """The clients waiting for the step, and the number of steps done. """
+        self.waiting = 0
+        self.steps = 0
+        self.condition = threading.Condition()
+
+    def call(self, domain_name, name, args):
+        """Calls the function of the domain of the network."""
+        with self.condition:
+            return getattr(getattr(self.traci, domain_name), name)(*args)
+
+    def simulationStep(self):
+        """Waits all clients to ask for the step, the last one runs it."""
+        with self.condition:
+            step = self.steps
+            self.waiting += 1
+            self.advance()
+            while self.steps == step:
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            self.clients -= 1
+            self.advance()
+
+    def advance(self):
+        if self.waiting > 0 and self.waiting >= self.clients:
+            self.traci.simulationStep()
+            self.waiting = 0
+            self.steps += 1
+            self.condition.notify_all()
+
+class FakeManager(BaseManager):
+    """Serves a FakeServer to the client processes."""
+    pass
+
+FakeManager.register("FakeServer", FakeServer)
+
+class Domain(object):
+    """A domain of a FakeClient, whose functions call the server."""
+    pass
+
+class FakeClient(object):
+    """A client of a FakeServer, with the TraCI API.
+    """
+
+    FatalTraCIError = FatalTraCIError
+    constants = constants
+
+    """The domains of the network, and the prefixes of their functions. """
+    DOMAINS = {"lane": LaneDomain, "trafficlights": TrafficLightsDomain,
+               "lanearea": LaneAreaDomain, "simulation": SimulationDomain}
+    PREFIXES = ("get", "set", "subscribe")
+
+    def __init__(self, server):
+        """The proxy of the server, and the order of this client in each step. """
+        self.server = server
+        self.order = None
+        for domain_name, domain_class in self.DOMAINS.items():
+            domain = Domain()
+            for name in dir(domain_class):
+                if name.startswith(self.PREFIXES):
+                    setattr(domain, name, self.remote(domain_name, name))
+            setattr(self, domain_name, domain)
+
+    def remote(self, domain_name, name):
+        """Returns a function that calls the function of the server domain."""
+        def call(*args):
+            return self.server.call(domain_name, name, args)
+        call.__name__ = name
+        return call
+
+    def init(self, port=None):
+        """The server is already connected, the port is not used."""
+        pass
+
+    def setOrder(self, order):
+        """The order has no effect, the calls are run as they arrive."""
+        self.order = order
+
+    def close(self):
+        self.server.close()
+
+    def simulationStep(self, step=0):
+        self.server.simulationStep()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Fixed size history of the lanes measures, kept for the last window of steps.
+
+The samples of each metric are kept in a ring buffer of lanes x window
+values, in a single array, so the memory used is the same during the whole
+execution. The samples are read by lane and step, as the dicts they replace.
+
+A history may also keep the running sums of each lane, over the window and
+since a marked step, and the running mean and sum of squared deviations of
+each lane over the window (Welford), updated at each sample and recomputed
+exactly at each turn of the ring, so the rounding errors do not pile up.
+"""
+
+from array import array
+from math import sqrt
+
+# Export the history classes
+__all__ = ['StepWindow', 'RingHistory']
+
+class StepWindow(object):
+    """The slots of the ring buffers, given to the last window of sampled steps.
+
+    It is shared by the metrics sampled at the same steps, the slot of the
+    oldest step is given to the next one.
+    """
+
+    def __init__(self, size):
+        """The number of slots, the slot of each step and the step of each slot. """
+        self.size = size
+        self.slots = dict()
+        self.steps = array("l", [-1]) * size
+
+        """The slot of the next sampled step, the oldest one when the window is full. """
+        self.head = 0
+
+        """The histories that keep running sums or deviations. """
+        self.histories = []
+
+        """The step dropped by the last sampled step, None if the window was not full. """
+        self.dropped = None
+
+        """The marked step, None for the whole window, and the number of steps since it in the window. """
+        self.since = None
+        self.since_count = 0
+
+    def is_since(self, step):
+        """Verify if the step is counted in the sums since the marked step."""
+        return self.since is None or step >= self.since
+
+    def append(self, step):
+        """Gives a slot to the sampled step, dropping the oldest step if the window is full."""
+        oldest = self.steps[self.head]
+        self.dropped = oldest if oldest >= 0 else None
+        if oldest >= 0:
+            for history in self.histories:
+                history.evict(self.head, oldest)
+            if self.is_since(oldest):
+                self.since_count -= 1
+            del self.slots[oldest]
+        self.steps[self.head] = step
+        self.slots[step] = self.head
+        if self.is_since(step):
+            self.since_count += 1
+        if oldest < 0:
+            for history in self.histories:
+                history.grow()
+        self.head = (self.head + 1) % self.size
+        if self.head == 0:
+            for history in self.histories:
+                history.refresh()
+
+    def mark(self, step):
+        """Starts the sums since the given step, usually the last sampled one."""
+        self.since = step
+        self.since_count = sum(1 for slot_step in self.slots if self.is_since(slot_step))
+        for history in self.histories:
+            history.refresh_since()
+
+    def ordered_slots(self):
+        """The slots of the window in the order of their steps."""
+        if len(self.slots) < self.size:
+            return range(self.head)
+        return range(self.head, self.size) + range(self.head)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, step):
+        return step in self.slots
+
+class LaneHistory(object):
+    """The view of a lane in the history, its samples indexed by step."""
+
+    def __init__(self, history, row):
+        self.history = history
+        self.row = row
+        self.offset = row * history.clock.size
+
+    def __getitem__(self, step):
+        return self.history.data[self.offset + self.history.clock.slots[step]]
+
+    def __setitem__(self, step, value):
+        history = self.history
+        index = self.offset + history.clock.slots[step]
+        if history.sums is not None:
+            change = value - history.data[index]
+            history.sums[self.row] += change
+            if history.clock.is_since(step):
+                history.since_sums[self.row] += change
+        if history.means is not None:
+            history.replace(self.row, history.data[index], value)
+        history.data[index] = value
+
+    def __contains__(self, step):
+        return step in self.history.clock
+
+    def __len__(self):
+        return len(self.history.clock)
+
+    def keys(self):
+        clock = self.history.clock
+        if len(clock) < clock.size:
+            return clock.steps[:clock.head].tolist()
+        return (clock.steps[clock.head:] + clock.steps[:clock.head]).tolist()
+
+    def values(self):
+        """The samples in the order of their steps, in a contiguous array."""
+        data, clock = self.history.data, self.history.clock
+        start, end = self.offset, self.offset + clock.size
+        if len(clock) < clock.size:
+            return data[start:start + clock.head]
+        return data[start + clock.head:end] + data[start:start + clock.head]
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def __repr__(self):
+        return "{" + ", ".join("%r: %r" % item for item in self.items()) + "}"
+
+class RingHistory(object):
+    """The samples of a metric for each lane, in the steps of a window.
+
+    The samples are written and read as history[lane][step], only for the
+    steps in the window, and history.window(lane) reads the samples of a
+    lane in the order of their steps.
+    """
+
+    def __init__(self, lanes, clock, typecode="d", sums=False, deviations=False):
+        """The steps window and the array of lanes x window samples, a row for each lane. """
+        self.clock = clock
+        rows = []
+        for lane_id in lanes:
+            if lane_id not in rows:
+                rows.append(lane_id)
+        self.data = array(typecode, [0]) * (len(rows) * clock.size)
+
+        """The view of each lane. {"lane":LaneHistory} """
+        self.lanes = dict((lane_id, LaneHistory(self, row)) for row, lane_id in enumerate(rows))
+
+        """The sums of each row over the window and since the marked step, and the
+        samples of the dropped step, None if not kept. """
+        if sums:
+            self.sums = array("d", [0]) * len(rows)
+            self.since_sums = array("d", [0]) * len(rows)
+            self.dropped = array(typecode, [0]) * len(rows)
+        else:
+            self.sums = self.since_sums = self.dropped = None
+
+        """The mean of each row over the window and the sum of the squared differences
+        from it, None if not kept. """
+        if deviations:
+            self.means = array("d", [0]) * len(rows)
+            self.squares = array("d", [0]) * len(rows)
+        else:
+            self.means = self.squares = None
+
+        if sums or deviations:
+            clock.histories.append(self)
+
+    def evict(self, slot, step):
+        """Removes the samples of the dropped step from the sums, its slot is left
+        with 0 for the next step, so it is counted in the deviations."""
+        since = self.clock.is_since(step)
+        size, data = self.clock.size, self.data
+        for row in range(len(self.lanes)):
+            index = row * size + slot
+            if self.sums is not None:
+                self.sums[row] -= data[index]
+                if since:
+                    self.since_sums[row] -= data[index]
+                self.dropped[row] = data[index]
+            if self.means is not None:
+                self.replace(row, data[index], 0)
+            data[index] = 0
+
+    def grow(self):
+        """Counts the new slot of the window, still 0, in the deviations."""
+        if self.means is None:
+            return
+        count = len(self.clock)
+        for row in range(len(self.means)):
+            change = -self.means[row]
+            self.means[row] += change / count
+            self.squares[row] += change * -self.means[row]
+
+    def replace(self, row, old, new):
+        """Replaces a sample of the row in the deviations, the window keeps its size."""
+        mean = self.means[row]
+        self.means[row] = mean + (new - old) / float(len(self.clock))
+        self.squares[row] += (new - old) * (new - self.means[row] + old - mean)
+
+    def refresh(self):
+        """Recomputes the sums and deviations from the samples, in the order of their steps."""
+        slots = self.clock.ordered_slots()
+        since_slots = slots[len(slots) - self.clock.since_count:]
+        size, data = self.clock.size, self.data
+        for row in range(len(self.lanes)):
+            offset = row * size
+            if self.sums is not None:
+                self.sums[row] = float(sum(data[offset + slot] for slot in slots))
+                self.since_sums[row] = float(sum(data[offset + slot] for slot in since_slots))
+            if self.means is not None:
+                mean = float(sum(data[offset + slot] for slot in slots)) / len(slots)
+                self.means[row] = mean
+                self.squares[row] = sum(pow(data[offset + slot] - mean, 2) for slot in slots)
+
+    def refresh_since(self):
+        """Recomputes the sums since the marked step, from its samples."""
+        slots = self.clock.ordered_slots()
+        since_slots = slots[len(slots) - self.clock.since_count:]
+        size, data = self.clock.size, self.data
+        for row in range(len(self.since_sums)):
+            offset = row * size
+            self.since_sums[row] = float(sum(data[offset + slot] for slot in since_slots))
+
+    def __getitem__(self, lane_id):
+        return self.lanes[lane_id]
+
+    def __contains__(self, lane_id):
+        return lane_id in self.lanes
+
+    def window_average(self, lane_id):
+        """The average of the samples of the lane in the window, 0 if there is none."""
+        if not len(self.clock):
+            return 0
+        return self.sums[self.lanes[lane_id].row] / len(self.clock)
+
+    def window_deviation(self, lane_id):
+        """The sample standard deviation of the lane in the window, 0 if there is one sample."""
+        count = len(self.clock)
+        if count < 2:
+            return 0
+        return sqrt(max(0, self.squares[self.lanes[lane_id].row] / (count - 1)))
+
+    def dropped_sample(self, lane_id):
+        """The sample of the lane at the step dropped by the last sampled step, see StepWindow.dropped."""
+        return self.dropped[self.lanes[lane_id].row]
+
+    def since_sum(self, lane_id):
+        """The sum of the samples of the lane since the marked step, the clock counts them."""
+        return self.since_sums[self.lanes[lane_id].row]
+
+    def window(self, lane_id):
+        """The samples of the lane in the order of their steps, in a contiguous array."""
+        return self.lanes[lane_id].values()
+
+    def __repr__(self):
+        return "{" + ", ".join("%r: %r" % item for item in self.lanes.items()) + "}"
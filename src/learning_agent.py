@@ -136,8 +136,7 @@ class LearningAgent(Agent):#, Learning
             #"""
 
         if new_action is not None:
-            cycle_length = sum(phase.duration for phase in self.program_current.phases
-                           if phase.has_green)
+            cycle_length = self.program_current.phase_green_time()
             #(inc_idx, increment) = new_action
             (inc_idx, action_factor) = new_action
             increment = round(action_factor * self.program_current.phases[inc_idx].duration, 1)
@@ -187,6 +186,7 @@ class LearningAgent(Agent):#, Learning
         self.last_state = new_state
         self.last_action = new_action
         self.last_step_action = self.memory_window[-1]
+        self.history_window.mark(self.last_step_action)
         #data.append("Phases: "+str(self.program_current.phases))
         data.append("CycleTime: "+str(self.program_current.phase_cycle_time()))
         print " # ".join(data)
@@ -199,8 +199,7 @@ class LearningAgent(Agent):#, Learning
         lanes_by_phase = map(lambda l: l, lanes_by_phase)
         data = ["\nLanes: "+str(lanes_by_phase)]
 
-        phase_occupancies = [self.average([self.vehicular_occupancy[lane_id[0]][step]
-                                   for step in self.memory_window])
+        phase_occupancies = [self.vehicular_occupancy.window_average(lane_id[0])
                                    for lane_id in lanes_by_phase]
 
         # Update the bias that affect the random behavior
@@ -234,12 +233,14 @@ class LearningAgent(Agent):#, Learning
                           if phase.has_green)
         lanes_by_phase = map(lambda l: l, lanes_by_phase)
 
+        # The samples since the last action are kept by the history, and as
+        # before each mean also counts the samples of the previous phases.
         means = []
-        items = []
-        for lane_id in lanes_by_phase:
-            for step in filter(lambda s: s >= self.last_step_action,self.memory_window):
-                items.append(self.vehicular_occupancy[lane_id[0]][step])
-            means.append(self.average(items))
+        total = 0.0
+        count = self.history_window.since_count
+        for phase, lane_id in enumerate(lanes_by_phase):
+            total += self.vehicular_occupancy.since_sum(lane_id[0])
+            means.append(total / ((phase + 1) * count) if count else 0)
 
         reward = 1 - self.average(means)
         return (reward**self.reward_exponent * 2) - 1
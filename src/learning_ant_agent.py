@@ -2,8 +2,6 @@
 #-*- coding: utf-8 -*-
 
 from random import choice
-from copy import deepcopy
-import traci
 from ant import Ant
 from learning_agent import LearningAgent
 from rlcd import RLContextDetection
@@ -22,7 +20,7 @@ class LearningAntAgent(Ant,LearningAgent):#, Learning
         #self.memory_loss_factor = memory_loss_factor
         """Limited memory of the best programs acquired. A set of tuples {("value","program")} """
         self.program_memory = RLContextDetection(omega, rho, len(self.qtable.states), memory_loss_factor)#(omega, rho)
-        self.program_memory.add_items(self.possible_plans)
+        self.program_memory.add_items([[state.plan] for state in self.plans.itervalues()])
         #self.program_memory.add_item(self.program_current)
         #print "LearningAntAgent created"
 
@@ -87,7 +85,7 @@ class LearningAntAgent(Ant,LearningAgent):#, Learning
 
         # Update the qtable in the N>1 actions
         if self.last_state:
-            #print "P.Ids: ", map(lambda pid: int(pid), [p[0].id for p in self.possible_plans])
+            #print "P.Ids: ", self.plans.keys()
             reward = self.calculate_reward()
             self.qtable.observe(self.last_state, self.last_action, new_state, reward)
 
@@ -99,21 +97,17 @@ class LearningAntAgent(Ant,LearningAgent):#, Learning
             #
             # for Ant act()
             #
-            current_agent_tendency = self.program_tendency[self.current_plan_index]
-            programs_indexes = [i for (i, p) in enumerate(self.possible_plans) if p[1] >= current_agent_tendency]
-            plans = []
-            for index in programs_indexes:
-                plans.append(self.possible_plans[index][0])
+            current_agent_tendency = self.current_plan.tendency
+            plans = [state.plan for state in self.plans.itervalues() if state.stimulus >= current_agent_tendency]
             plans.append(self.program_memory.get_best_item())
             plan = choice(plans)
-            plan.current_phase_index = traci.trafficlights.getPhase(self.id)
-            self.program_current.fill_with(plan, self.lanes)
+            plan.current_phase_index = self.sensor.phase(self.id)
+            self.program_current.switch_to(plan)
             if self.program_memory.is_current_item_worst(self.program_current.id):
-                item = deepcopy(self.program_default)
-                item.id = str(int(self.get_max_plan_id()) + 1)
+                item = self.plan_pool.plan(self.program_default, str(int(self.get_max_plan_id()) + 1))
                 # If we create a new plan, we add it to ant plan's
                 self.add_plan(item)
-                self.program_current = deepcopy(item)
+                self.program_current.switch_to(item)
                 # If the number of plans are overload, we remove it from ant plan's
                 # taking it by plan id
                 plan_id = self.program_memory.add_item(item)
@@ -128,8 +122,7 @@ class LearningAntAgent(Ant,LearningAgent):#, Learning
             #"""
 
         if new_action is not None:
-            cycle_length = sum(phase.duration for phase in self.program_current.phases
-                           if phase.has_green)
+            cycle_length = self.program_current.phase_green_time()
             (inc_idx, increment) = new_action
 
             # Increments the current phase
@@ -144,9 +137,7 @@ class LearningAntAgent(Ant,LearningAgent):#, Learning
                 self.program_current.phases[decr_idx].duration -= decrement
 
             # Compensates errors on float->int conversion
-            phs = [phase.duration for phase in self.program_current.phases
-                           if phase.has_green]
-            error = cycle_length - sum(phs)
+            error = cycle_length - self.program_current.phase_green_time()
             if error > 0:
                 # The cycle is higher than expected
                 if self.program_current.phases[inc_idx].has_max_duration:
@@ -166,6 +157,7 @@ class LearningAntAgent(Ant,LearningAgent):#, Learning
         self.last_state = new_state
         self.last_action = new_action
         self.last_step_action = self.memory_window[-1]
+        self.history_window.mark(self.last_step_action)
         # Learning Agent act()
         print "SA-CD actuate"
 
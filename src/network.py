@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Static data of the simulated network: controlled lanes, links, signal programs
+and lanes lengths. This data never changes during the simulation, so it is read
+only once and may be cached on disk between executions.
+"""
+
+import os
+import hashlib
+import pickle
+from collections import defaultdict
+from xml.etree import cElementTree as ElementTree
+from backend import traci, Logic, Phase, to_milliseconds
+
+# Export the metadata classes
+__all__ = ['TrafficLightMetadata', 'NetworkMetadata', 'load_metadata']
+
+"""The version of the saved metadata, it changes with the saved classes or their data, e.g. the lanes. """
+METADATA_FORMAT = 4
+
+class TrafficLightMetadata(object):
+    """Keeps the static data of a traffic light.
+    """
+
+    @staticmethod
+    def from_traci(id, lane_lengths=None):
+        """Reads the data of the traffic light from TraCI.
+
+        The lane_lengths dict is used as a cache for the lanes already known,
+        so lanes shared by many traffic lights are asked only once.
+        """
+        if lane_lengths is None:
+            lane_lengths = dict()
+        lanes = tuple(traci.trafficlights.getControlledLanes(id))
+        for lane_id in set(lanes).difference(lane_lengths):
+            lane_lengths[lane_id] = traci.lane.getLength(lane_id)
+        return TrafficLightMetadata(id, lanes,
+                                    traci.trafficlights.getControlledLinks(id),
+                                    traci.trafficlights.getCompleteRedYellowGreenDefinition(id),
+                                    traci.trafficlights.getProgram(id),
+                                    dict((lane_id, lane_lengths[lane_id]) for lane_id in set(lanes)))
+
+    def __init__(self, id, lanes, links, programs, program_id, lane_lengths):
+        """The traffic light identifier. """
+        self.id = id
+
+        """The controlled lanes, maybe duplicated, one for each link index. An index
+        without links has an empty lane, so the lanes follow the phases states. """
+        self.lanes = lanes
+
+        """The controlled links. """
+        self.links = links
+
+        """The signal programs as read from TraCI, and the current one identifier. """
+        self.programs = programs
+        self.program_id = program_id
+
+        """The length of each controlled lane, without the empty ones. {"lane":"length"} """
+        self.lane_lengths = lane_lengths
+
+    @property
+    def program(self):
+        """The signal program that is running when the simulation starts."""
+        return next(prog for prog in self.programs if prog._subID == self.program_id)
+
+class NetworkMetadata(object):
+    """Keeps the static data of all traffic lights of a network.
+    """
+
+    @staticmethod
+    def from_traci():
+        """Reads the data of all traffic lights from TraCI."""
+        lane_lengths = dict()
+        return NetworkMetadata([TrafficLightMetadata.from_traci(id, lane_lengths)
+                                for id in traci.trafficlights.getIDList()])
+
+    @staticmethod
+    def from_net_file(net_file):
+        """Reads the data of all traffic lights straight from a SUMO network file.
+
+        The file is streamed and each top level element is dropped after read,
+        so the memory does not grow with the number of junctions and no TraCI
+        connection is needed. The lanes, links and phases are the same that
+        TraCI gives: the lanes are indexed by link index and the phases
+        duration are in milliseconds. As in SUMO, the running program is the
+        last one loaded for the traffic light. A link index without connections, a gap
+        in the indexes, has no links and an empty lane, so the lanes keep the
+        positions of the phases states.
+        """
+        lane_lengths = dict()
+        programs = defaultdict(list)
+        links = defaultdict(dict)
+        ids = []
+
+        depth = 0
+        context = ElementTree.iterparse(net_file, events=("start", "end"))
+        event, root = next(context)
+        for event, elem in context:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth > 0:
+                # Nested elements are read with their parent
+                continue
+
+            if elem.tag == "edge" and elem.get("function") != "internal":
+                for lane in elem.iter("lane"):
+                    lane_lengths[lane.get("id")] = float(lane.get("length"))
+            elif elem.tag == "tlLogic":
+                phases = [Phase(to_milliseconds(phase.get("duration")),
+                                                    to_milliseconds(phase.get("minDur", phase.get("duration"))),
+                                                    to_milliseconds(phase.get("maxDur", phase.get("duration"))),
+                                                    phase.get("state"))
+                          for phase in elem.iter("phase")]
+                if elem.get("id") not in programs:
+                    ids.append(elem.get("id"))
+                programs[elem.get("id")].append(Logic(elem.get("programID"), 0, 0, 0, phases))
+            elif elem.tag == "connection" and elem.get("tl") is not None:
+                link = (elem.get("from") + "_" + elem.get("fromLane"),
+                        elem.get("to") + "_" + elem.get("toLane"),
+                        elem.get("via", ""))
+                links[elem.get("tl")].setdefault(int(elem.get("linkIndex")), []).append(link)
+            root.clear()
+
+        traffic_lights = []
+        for id in ids:
+            size = max([max(links[id]) + 1 if links[id] else 0] +
+                       [len(phase._phaseDef) for logic in programs[id] for phase in logic._phases])
+            controlled_links = [links[id].get(idx, []) for idx in range(size)]
+            lanes = tuple(link[0][0] if link else "" for link in controlled_links)
+            traffic_lights.append(TrafficLightMetadata(id, lanes, controlled_links,
+                                                       programs[id], programs[id][-1]._subID,
+                                                       dict((lane_id, lane_lengths[lane_id])
+                                                            for lane_id in set(lanes) if lane_id)))
+        return NetworkMetadata(traffic_lights)
+
+    @staticmethod
+    def load(path):
+        """Loads the data saved by a previous execution."""
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def __init__(self, traffic_lights):
+        """The traffic lights metadata, in the order given by SUMO. """
+        self.traffic_lights = traffic_lights
+        self.__by_id = dict((tls.id, tls) for tls in traffic_lights)
+
+    @property
+    def ids(self):
+        """List of the traffic lights identifiers."""
+        return [tls.id for tls in self.traffic_lights]
+
+    def __getitem__(self, id):
+        return self.__by_id[id]
+
+    def save(self, path):
+        """Saves the data to be loaded by the next executions."""
+        with open(path, "wb") as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+def network_hash(net_file):
+    """The hash of the SUMO network file content and of the metadata format."""
+    digest = hashlib.sha1("metadata format %d\n" % METADATA_FORMAT)
+    with open(net_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), ""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_metadata(net_file, cache_dir):
+    """Loads the network metadata from the cache, keyed by the network file hash.
+
+    If there is no cached data for this network yet, it is read from the
+    network file and saved on the cache directory for the next executions.
+    Cached data that fails to load, e.g. saved by another version, is read
+    again from the network file.
+    """
+    path = os.path.join(cache_dir, network_hash(net_file) + ".pickle")
+    try:
+        metadata = NetworkMetadata.load(path)
+        if isinstance(metadata, NetworkMetadata):
+            return metadata
+    except Exception:
+        # Unpickling may raise almost any error on data of other versions
+        pass
+
+    metadata = NetworkMetadata.from_net_file(net_file)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        metadata.save(path)
+    except (IOError, OSError) as message:
+        print "Warning: Failed to save the network metadata cache."
+        print "\nMessage: ", message
+    return metadata
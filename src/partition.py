@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Partitioned control: the traffic lights are split in parts of neighbours and
+each part is controlled by its own process, through its own TraCI connection.
+
+SUMO must accept a client for each part (sumo --num-clients N), it runs a
+step only when all clients asked for it, in the order set by each client.
+"""
+
+import sys
+import traceback
+import multiprocessing
+from time import time, sleep
+from collections import defaultdict, deque
+from backend import traci
+from constants import STEPS_LIMIT, FLOW_STEPS
+
+# Export the partition classes
+__all__ = ['partition', 'Coordinator']
+
+def edge_of(lane_id):
+    """The edge of a lane, the lane id without its index."""
+    return lane_id.rsplit("_", 1)[0]
+
+def partition(metadata, count):
+    """Splits the traffic lights in up to count parts of neighbours, with about the same number of lanes.
+
+    Two traffic lights are neighbours when a link of one leads to a lane
+    controlled by the other. The traffic lights are ordered by a breadth
+    first search of each connected component, in the order given by SUMO,
+    and the order is cut in parts, so each part keeps whole components or
+    compact pieces of them.
+    """
+    # The traffic lights that control the lanes of each edge
+    controllers = defaultdict(set)
+    for tls in metadata.traffic_lights:
+        for lane_id in tls.lane_lengths:
+            controllers[edge_of(lane_id)].add(tls.id)
+
+    neighbours = defaultdict(set)
+    for tls in metadata.traffic_lights:
+        for links in tls.links:
+            for link in links:
+                for other in controllers.get(edge_of(link[1]), ()):
+                    if other != tls.id:
+                        neighbours[tls.id].add(other)
+                        neighbours[other].add(tls.id)
+
+    order = []
+    visited = set()
+    for id in metadata.ids:
+        if id in visited:
+            continue
+        visited.add(id)
+        queue = deque([id])
+        while queue:
+            current = queue.popleft()
+            order.append(current)
+            for other in sorted(neighbours[current].difference(visited)):
+                visited.add(other)
+                queue.append(other)
+
+    weights = dict((id, len(metadata[id].lane_lengths)) for id in order)
+    total = float(sum(weights.values())) or 1.0
+    parts = [[] for _ in range(count)]
+    done = 0
+    for id in order:
+        parts[min(count - 1, int(done * count / total))].append(id)
+        done += weights[id]
+    return [part for part in parts if part]
+
+class Coordinator(object):
+    """Runs a process for each part of the traffic lights and collects their statistics.
+
+    The processes are kept in lock step by the simulation, and the
+    coordinator follows the step of each one through shared memory, so it
+    tells the progress and the largest distance between them. If a process
+    fails, the others are stopped, as they would wait for it forever.
+    """
+
+    def __init__(self, parts, connect, create_sensor, create_agents, seed=None):
+        """The parts and the functions run by each process.
+
+        connect(index) selects the backend and opens the connection of the
+        part; create_sensor() returns its sensor hub and
+        create_agents(ids, sensor, actuator) its agents.
+        """
+        self.parts = parts
+        self.connect = connect
+        self.create_sensor = create_sensor
+        self.create_agents = create_agents
+        self.seed = seed
+
+        """The current step of each part. """
+        self.steps = multiprocessing.Array("i", len(parts), lock=False)
+
+        """The largest distance in steps between the parts. """
+        self.max_skew = 0
+
+        """The statistics of each part, and the error of the failed one. """
+        self.statistics = [None] * len(parts)
+        self.error = None
+
+    def run(self):
+        """Runs the processes until all finished or one failed, returns True on success."""
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=self.work, args=(index, results),
+                                             name="partition-%d" % index)
+                     for index in range(len(self.parts))]
+        for process in processes:
+            process.start()
+
+        start = time()
+        finished = 0
+        while finished < len(processes) and self.error is None:
+            while not results.empty():
+                index, statistics, error = results.get()
+                finished += 1
+                if error is not None:
+                    self.error = "Partition %d failed:\n%s" % (index, error)
+                else:
+                    self.statistics[index] = statistics
+            if self.error is None and finished < len(processes):
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    self.error = "The partitions stopped without their statistics."
+                steps = list(self.steps)
+                self.max_skew = max(self.max_skew, max(steps) - min(steps))
+                sys.stdout.write("\rTimestep #%d of all partitions, %5.3f s " % (min(steps), time() - start))
+                sys.stdout.flush()
+                sleep(0.1)
+
+        if self.error is not None:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+        for process in processes:
+            process.join()
+        return self.error is None
+
+    def work(self, index, results):
+        """Controls the part of the traffic lights, in its own process."""
+        try:
+            if self.seed is not None:
+                from random import seed
+                seed(self.seed + index)
+            results.put((index, self.control(index), None))
+        except BaseException:
+            results.put((index, None, traceback.format_exc()))
+
+    def control(self, index):
+        """The simulation loop of the part, returns its statistics."""
+        from actuators import BatchActuator
+        from scheduler import Scheduler
+        self.connect(index)
+        sensor = self.create_sensor()
+        actuator = BatchActuator(sensor)
+        agents = self.create_agents(self.parts[index], sensor, actuator)
+        scheduler = Scheduler(agents)
+
+        step_time = agents_time = 0.0
+        total_departed = total_arrived = 0
+        time_step = 1
+        while True:
+            # The same end of the serial execution, all parts see the same vehicles
+            if time_step > STEPS_LIMIT or (time_step > FLOW_STEPS and total_arrived == total_departed):
+                traci.close()
+                break
+
+            start = time()
+            traci.simulationStep()
+            sensor.update()
+            total_departed += traci.simulation.getDepartedNumber()
+            total_arrived += traci.simulation.getArrivedNumber()
+            step_time += time() - start
+
+            start = time()
+            scheduler.update(time_step)
+            actuator.flush()
+            agents_time += time() - start
+
+            self.steps[index] = time_step
+            time_step += 1
+
+        return dict(index=index, traffic_lights=len(agents), lanes=len(sensor.lanes), steps=time_step - 1,
+                    step_time=step_time, agents_time=agents_time, actuator=str(actuator),
+                    agents=[str(agent) for agent in agents],
+                    qtables=[agent.save_qtable() for agent in agents if hasattr(agent, "save_qtable")])
+
+    def report(self):
+        """Returns the text report of the statistics of each part."""
+        data = ["Partitions: %d, max step distance: %d" % (len(self.parts), self.max_skew)]
+        for statistics in self.statistics:
+            if statistics is None:
+                continue
+            data.append("#%(index)d: %(traffic_lights)d traffic lights, %(lanes)d lanes, %(steps)d steps, "
+                        "step %(step_time).3f s, agents %(agents_time).3f s, %(actuator)s" % statistics)
+        return "\n".join(data)
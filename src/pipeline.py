@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Pipelined stepping: the agents decide on the measures of a step in a worker
+thread while SUMO runs the next step, and their actuations are sent with a lag.
+"""
+
+import sys
+import pickle
+import threading
+from Queue import Queue
+from collections import deque
+from copy import deepcopy
+
+# Export the pipeline classes
+__all__ = ['PipelinedSensor', 'Pipeline', 'DecisionLog']
+
+class PipelinedSensor(object):
+    """The sensor of the agents in the pipelined mode.
+
+    The subscriptions go to the hub, and the measures are read from the
+    snapshot of the step being decided, so the agents never call TraCI
+    while the main thread runs the simulation.
+    """
+
+    def __init__(self, hub):
+        """The hub that reads the measures, and its snapshot of the step being decided. """
+        if hub.aggregated:
+            raise ValueError("The pipelined mode needs the measures of every step, "
+                             "it can not be used with an aggregated sensor.")
+        self.hub = hub
+        self.aggregated = hub.aggregated
+        self.snapshot = None
+
+    def subscribe(self, lanes):
+        self.hub.subscribe(lanes)
+
+    def subscribe_traffic_light(self, tls_id):
+        self.hub.subscribe_traffic_light(tls_id)
+
+    def halting_number(self, lane_id):
+        return self.snapshot.halting_number(lane_id)
+
+    def occupancy(self, lane_id):
+        return self.snapshot.occupancy(lane_id)
+
+    def vehicle_number(self, lane_id):
+        return self.snapshot.vehicle_number(lane_id)
+
+    def phase(self, tls_id):
+        return self.snapshot.phase(tls_id)
+
+class Pipeline(object):
+    """Runs the agents updates in a worker thread, overlapped with the simulation steps.
+
+    At each step, after the simulation step and the hub update, step() waits
+    for the agents to decide on the previous step, sends the decisions whose
+    lag is over, and starts the agents on the current step. A decision made
+    on the measures of step t is sent after the simulation step t+lag, while
+    in the serial mode it is sent before the simulation step t+1.
+    """
+
+    def __init__(self, agents, sensor, actuator, lag=1, decision_log=None):
+        """The agents, their pipelined sensor and the batch actuator shared by them. """
+        if lag < 1:
+            raise ValueError("The pipeline lag must be at least one step: %d." % lag)
+        self.agents = agents
+        self.sensor = sensor
+        self.actuator = actuator
+
+        """The number of steps between a decision and its actuation. """
+        self.lag = lag
+
+        """The log of the decisions, by the step of their measures, or None. """
+        self.decision_log = decision_log
+
+        """The decisions waiting for their lag. [("step","{tls:(program, switch)}")] """
+        self.lagged = deque()
+
+        """The step being decided by the agents, None if the worker is idle. """
+        self.deciding = None
+
+        self.tasks = Queue()
+        self.results = Queue()
+        self.worker = threading.Thread(target=self.work, name="agents")
+        self.worker.daemon = True
+        self.worker.start()
+
+    def work(self):
+        """The worker loop, updates the agents for each step received, until None."""
+        while True:
+            step = self.tasks.get()
+            if step is None:
+                break
+            try:
+                for agent in self.agents:
+                    agent.update(step)
+                self.results.put(None)
+            except Exception:
+                self.results.put(sys.exc_info())
+
+    def wait(self):
+        """Waits the agents to decide the current step, and keeps their decisions for the lag.
+        """
+        if self.deciding is None:
+            return
+        error = self.results.get()
+        step, self.deciding = self.deciding, None
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+        # The agents keep changing their programs, so the pushed ones are copied
+        decisions = dict((tls_id, (deepcopy(program), switch))
+                         for tls_id, (program, switch) in self.actuator.pending.items())
+        self.actuator.pending.clear()
+        if self.decision_log is not None:
+            self.decision_log.record(step, decisions, self.actuator)
+        self.lagged.append((step + self.lag, decisions))
+
+    def step(self, time_step):
+        """Sends the decisions due at this step and starts the agents on its measures.
+
+        It must be called after the simulation step and the hub update.
+        """
+        self.wait()
+        while self.lagged and self.lagged[0][0] <= time_step:
+            self.actuator.pending.update(self.lagged.popleft()[1])
+        self.actuator.flush()
+
+        self.sensor.snapshot = self.sensor.hub.snapshot()
+        self.deciding = time_step
+        self.tasks.put(time_step)
+
+    def stop(self):
+        """Waits the last decision and stops the worker, the decisions not sent are dropped."""
+        try:
+            self.wait()
+        finally:
+            self.tasks.put(None)
+            self.worker.join()
+
+class DecisionLog(object):
+    """Keeps the programs pushed by the agents, by the step of the measures they were decided on.
+
+    The decisions of a pipelined execution are compared with the ones of a
+    serial execution to tell how much the lag changes the agents behaviour.
+    """
+
+    @staticmethod
+    def load(path):
+        """Loads the decisions saved by a previous execution."""
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def __init__(self):
+        """The decisions. {("step","tls"):("switch","signature")} """
+        self.decisions = dict()
+
+    def record(self, step, pending, actuator):
+        """Keeps the pushes {tls:(program, switch)} decided on the measures of the step."""
+        for tls_id, (program, switch) in pending.items():
+            self.decisions[(step, tls_id)] = (switch, actuator.signature(program))
+
+    def save(self, path):
+        """Saves the decisions to be compared by the next executions."""
+        with open(path, "wb") as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    def compare(self, reference):
+        """Returns the text report of the differences from the reference decisions.
+        """
+        keys = set(self.decisions) | set(reference.decisions)
+        same = set(key for key in keys if self.decisions.get(key) == reference.decisions.get(key))
+        changed = [key for key in keys if key in self.decisions and key in reference.decisions
+                   and self.decisions[key] != reference.decisions[key]]
+        missing = [key for key in keys if key not in self.decisions]
+        extra = [key for key in keys if key not in reference.decisions]
+
+        data = []
+        data.append("Decisions: %d, reference: %d" % (len(self.decisions), len(reference.decisions)))
+        data.append("same=%d changed=%d missing=%d extra=%d" % (len(same), len(changed), len(missing), len(extra)))
+        if keys:
+            data.append("agreement=%.2f%%" % (100.0 * len(same) / len(keys)))
+        if len(same) < len(keys):
+            data.append("first difference at step %d" % min(key[0] for key in keys if key not in same))
+
+        # The durations difference of the decisions with the same phases
+        differences = []
+        for key in changed:
+            phases = self.decisions[key][1][1]
+            reference_phases = reference.decisions[key][1][1]
+            if len(phases) == len(reference_phases):
+                differences.extend(abs(phase[1] - reference_phase[1])
+                                   for phase, reference_phase in zip(phases, reference_phases))
+        if differences:
+            data.append("changed durations: mean=%.1f ms max=%.1f ms"
+                        % (float(sum(differences)) / len(differences), max(differences)))
+        return "\n".join(data)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Accounting of the TraCI calls made by the controller.
+"""
+
+from time import time
+from collections import defaultdict
+from backend import traci
+
+class TraciProfiler(object):
+    """Counts and times every TraCI call, by domain and method, by agent and by step.
+
+    The profiler replaces the functions of the TraCI domains by wrappers, so
+    the calls made from any module are accounted without changing them.
+    """
+
+    """The TraCI domains whose functions are accounted. """
+    DOMAINS = ("lane", "trafficlights", "simulation")
+
+    """The prefixes of the functions accounted in each domain. """
+    PREFIXES = ("get", "set", "subscribe", "unsubscribe")
+
+    """The name used for the calls made outside of an agent update. """
+    CONTROLLER = "<controller>"
+
+    def __init__(self):
+        """The number of calls and the time spent, by (domain, method). """
+        self.calls = defaultdict(int)
+        self.times = defaultdict(float)
+
+        """The number of calls and the time spent, by (agent, domain, method). """
+        self.agent_calls = defaultdict(int)
+        self.agent_times = defaultdict(float)
+
+        """The number of calls and the time spent, by step. """
+        self.step_calls = defaultdict(int)
+        self.step_times = defaultdict(float)
+
+        """The agent being updated and the current step, 0 before the first step. """
+        self.agent = self.CONTROLLER
+        self.step = 0
+
+    def install(self, module=None):
+        """Wraps the functions of the TraCI module with the accounting ones.
+
+        By default, the functions of the selected backend are wrapped.
+        """
+        if module is None:
+            module = traci.selected()
+        for domain_name in self.DOMAINS:
+            domain = getattr(module, domain_name)
+            for name in dir(domain):
+                function = getattr(domain, name)
+                if name.startswith(self.PREFIXES) and callable(function):
+                    setattr(domain, name, self.wrap(domain_name, name, function))
+        module.simulationStep = self.wrap("", "simulationStep", module.simulationStep)
+
+    def wrap(self, domain_name, name, function):
+        """Returns a function that calls the given one and accounts it.
+        """
+        key = (domain_name, name)
+        def accounted(*args, **kwds):
+            if name == "simulationStep":
+                self.step += 1
+            start = time()
+            try:
+                return function(*args, **kwds)
+            finally:
+                self.account(key, time() - start)
+        accounted.__name__ = name
+        accounted.__doc__ = function.__doc__
+        return accounted
+
+    def account(self, key, time_diff):
+        """Accounts a call to the (domain, method) key that took time_diff seconds.
+        """
+        self.calls[key] += 1
+        self.times[key] += time_diff
+        self.agent_calls[(self.agent,) + key] += 1
+        self.agent_times[(self.agent,) + key] += time_diff
+        self.step_calls[self.step] += 1
+        self.step_times[self.step] += time_diff
+
+    def update_agent(self, agent, step):
+        """Updates the agent, accounting the calls made by it.
+        """
+        self.agent = agent.id
+        try:
+            agent.update(step)
+        finally:
+            self.agent = self.CONTROLLER
+
+    def report(self, top=20):
+        """Returns the text report of the top calls by count and by cumulative time.
+        """
+        data = []
+        data.append("TraCI calls: %d in %.3f s, %d steps" % (sum(self.calls.values()),
+                    sum(self.times.values()), self.step))
+
+        data.append("\nTop calls by count")
+        for key in sorted(self.calls, key=lambda k: self.calls[k], reverse=True)[:top]:
+            data.append("%10d %10.3f s  %s" % (self.calls[key], self.times[key], ".".join(filter(None, key))))
+
+        data.append("\nTop calls by cumulative time")
+        for key in sorted(self.times, key=lambda k: self.times[k], reverse=True)[:top]:
+            data.append("%10d %10.3f s  %s" % (self.calls[key], self.times[key], ".".join(filter(None, key))))
+
+        data.append("\nTop agents calls by count")
+        for key in sorted(self.agent_calls, key=lambda k: self.agent_calls[k], reverse=True)[:top]:
+            data.append("%10d %10.3f s  %s %s" % (self.agent_calls[key], self.agent_times[key],
+                        key[0], ".".join(filter(None, key[1:]))))
+
+        data.append("\nCalls by step")
+        steps = [step for step in self.step_calls if step > 0]
+        if steps:
+            data.append("mean=%.1f calls %.3f ms" % (float(sum(self.step_calls[s] for s in steps))/len(steps),
+                        1000 * sum(self.step_times[s] for s in steps)/len(steps)))
+            busiest = max(steps, key=lambda s: self.step_calls[s])
+            data.append("max=%d calls %.3f ms at step %d" % (self.step_calls[busiest],
+                        1000 * self.step_times[busiest], busiest))
+        data.append("startup=%d calls %.3f ms" % (self.step_calls[0], 1000 * self.step_times[0]))
+        return "\n".join(data)
+
+    def save(self, path, top=20):
+        """Writes the report to the file path."""
+        with open(path, "w+") as f:
+            f.write(self.report(top) + "\n")
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Recording of the TraCI calls of an execution, and their replay without a simulator.
+
+The recording keeps each request and response in a gzip compressed stream of
+pickled records, a block of them for each simulation step, each block read at
+once by the replay. The replay answers the same requests from the stream, so the
+agents run exactly as recorded, with no simulator noise, while their requests
+keep matching the recorded ones.
+"""
+
+import gzip
+import zlib
+import struct
+import cPickle as pickle
+from backend import Logic, Phase
+
+# Export the recording classes
+__all__ = ['RecordingBackend', 'ReplayBackend', 'ReplayDivergence', 'RECORDING_ERRORS']
+
+"""The version of the recording format. """
+VERSION = 1
+
+"""The TraCI domains recorded, and the prefixes of their recorded functions. """
+DOMAINS = ("lane", "trafficlights", "lanearea", "simulation")
+PREFIXES = ("get", "set", "subscribe", "unsubscribe")
+
+"""The header of each block, its length in bytes. """
+BLOCK_HEADER = struct.Struct("<I")
+
+"""The simulation control functions recorded. """
+CONTROL = ("init", "close", "simulationStep")
+
+"""The errors raised by reading a missing, truncated or corrupt recording. """
+RECORDING_ERRORS = (IOError, EOFError, struct.error, zlib.error, pickle.UnpicklingError)
+
+class ReplayDivergence(Exception):
+    """Raised when a request differs from the recorded one, or the recording has ended."""
+    pass
+
+class FatalTraCIError(Exception):
+    """Raised by the replay where the recorded simulation failed."""
+    pass
+
+def freeze(value):
+    """The comparable form of a request argument: programs become tuples of their data."""
+    if hasattr(value, "_phases"):
+        return (value._subID, value._type, value._subParameter, value._currentPhaseIndex,
+                tuple((phase._duration, phase._duration1, phase._duration2, phase._phaseDef)
+                      for phase in value._phases))
+    elif isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def portable(value):
+    """The form of a response kept in the recording, loadable without the backend that gave it."""
+    if hasattr(value, "_phases"):
+        return Logic(value._subID, value._type, value._subParameter, value._currentPhaseIndex,
+                     [Phase(phase._duration, phase._duration1, phase._duration2, phase._phaseDef)
+                      for phase in value._phases])
+    elif isinstance(value, list):
+        return [portable(item) for item in value]
+    elif isinstance(value, tuple):
+        return tuple(portable(item) for item in value)
+    elif isinstance(value, dict):
+        return dict((key, portable(item)) for key, item in value.items())
+    return value
+
+def request(name, args):
+    """The comparable form of the request arguments. The port given to init is not compared."""
+    if name == "init":
+        return ()
+    for arg in args:
+        if not isinstance(arg, (basestring, int, long, float)):
+            return freeze(args)
+    return args
+
+class Domain(object):
+    """A TraCI domain whose functions are set by the recording or the replay."""
+    pass
+
+class RecordingBackend(object):
+    """Forwards the calls to a backend and writes each request and response to a file.
+
+    Each record is (code, arguments, response, error), where the code is the
+    index of the function in the header table of functions.
+    """
+
+    def __init__(self, module, path, seed=None):
+        """The recorded backend and the stream of records. """
+        self.module = module
+        self.stream = gzip.open(path, "wb")
+
+        """The records of the current step, written at the end of it. """
+        self.block = []
+
+        """The recorded functions, (domain, name), by code. """
+        self.functions = []
+        for domain_name in DOMAINS:
+            domain = getattr(module, domain_name, None)
+            if domain is None:
+                continue
+            recorded = Domain()
+            for name in dir(domain):
+                function = getattr(domain, name)
+                if name.startswith(PREFIXES) and callable(function):
+                    setattr(recorded, name, self.wrap(domain_name, name, function))
+            setattr(self, domain_name, recorded)
+        for name in CONTROL:
+            setattr(self, name, self.wrap("", name, getattr(module, name)))
+        self.FatalTraCIError = module.FatalTraCIError
+
+        self.write_block({"version": VERSION, "seed": seed, "functions": self.functions})
+
+    def wrap(self, domain_name, name, function):
+        """Returns a function that calls the given one and records it.
+        """
+        code = len(self.functions)
+        self.functions.append((domain_name, name))
+        def recorded(*args):
+            try:
+                response = function(*args)
+            except self.module.FatalTraCIError as message:
+                self.write(code, request(name, args), None, str(message))
+                raise
+            self.write(code, request(name, args), response, None)
+            if name == "simulationStep":
+                self.flush()
+            elif name == "close":
+                self.flush()
+                self.stream.close()
+            return response
+        recorded.__name__ = name
+        return recorded
+
+    def write(self, code, args, response, error):
+        self.block.append((code, args, portable(response), error))
+
+    def flush(self):
+        """Writes the records kept since the last step."""
+        if not self.stream.closed:
+            self.write_block(self.block)
+        self.block = []
+
+    def write_block(self, data):
+        data = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        self.stream.write(BLOCK_HEADER.pack(len(data)) + data)
+
+class ReplayBackend(object):
+    """Answers the calls from a recording, checking that each request is the recorded one.
+
+    Any request that differs in function or arguments raises ReplayDivergence,
+    that tells the step and both requests.
+    """
+
+    FatalTraCIError = FatalTraCIError
+
+    def __init__(self, path):
+        """The stream of records, the number of records read and of steps replayed. """
+        self.stream = gzip.open(path, "rb")
+        self.calls = 0
+        self.step = 0
+
+        """The records of the current step and the position of the next one. """
+        self.block = []
+        self.position = 0
+
+        header = self.read_block()
+        if not isinstance(header, dict):
+            raise ValueError("The file is not a recording, its header is a %s." % type(header).__name__)
+        if header.get("version") != VERSION:
+            raise ValueError("Unknown recording version: %s." % header.get("version"))
+
+        """The seed of the random choices of the recorded execution, or None. """
+        self.seed = header["seed"]
+
+        """The recorded functions, (domain, name), by code. """
+        self.functions = header["functions"]
+        for code, (domain_name, name) in enumerate(self.functions):
+            if domain_name:
+                if not hasattr(self, domain_name):
+                    setattr(self, domain_name, Domain())
+                setattr(getattr(self, domain_name), name, self.wrap(code, name))
+            else:
+                setattr(self, name, self.wrap(code, name))
+
+    def wrap(self, code, name):
+        """Returns a function that answers the calls to the given function from the recording.
+        """
+        def replayed(*args):
+            return self.read(code, request(name, args))
+        replayed.__name__ = name
+        return replayed
+
+    def read(self, code, args):
+        """Reads the next record, checks it against the request and returns its response."""
+        while self.position == len(self.block):
+            try:
+                self.block = self.read_block()
+                self.position = 0
+            except RECORDING_ERRORS:
+                raise ReplayDivergence("The recording ended at call %d, step %d, before the request %s."
+                                       % (self.calls, self.step, self.describe(code, args)))
+        recorded_code, recorded_args, response, error = self.block[self.position]
+        self.position += 1
+        self.calls += 1
+        if recorded_code != code or recorded_args != args:
+            raise ReplayDivergence("The agents diverged from the recording at call %d, step %d."
+                                   "\nRecorded request: %s\nRequest: %s"
+                                   % (self.calls, self.step, self.describe(recorded_code, recorded_args),
+                                      self.describe(code, args)))
+        if self.functions[code][1] == "simulationStep":
+            self.step += 1
+        if error is not None:
+            raise FatalTraCIError(error)
+        return response
+
+    def read_block(self):
+        """Reads the next block, raises EOFError at the end of the recording.
+
+        A corrupt recording raises one of RECORDING_ERRORS.
+        """
+        header = self.stream.read(BLOCK_HEADER.size)
+        if not header:
+            raise EOFError("The recording has no more blocks.")
+        if len(header) < BLOCK_HEADER.size:
+            raise EOFError("The recording is truncated.")
+        size, = BLOCK_HEADER.unpack(header)
+        data = self.stream.read(size)
+        if len(data) < size:
+            raise EOFError("The recording is truncated.")
+        return pickle.loads(data)
+
+    def describe(self, code, args):
+        return "%s(%s)" % (".".join(filter(None, self.functions[code])), ", ".join(map(repr, args)))
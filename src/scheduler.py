@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Event driven scheduling of the agents updates.
+
+Each agent tells the next step in which it has work, and it is updated only
+at that step, so the idle agents cost nothing in the steps between. When no
+agent can skip a step, the agents are just updated in their list order.
+"""
+
+import heapq
+
+# Export the scheduler classes
+__all__ = ['Scheduler']
+
+class Scheduler(object):
+    """Wakes the agents at their next update step, kept in a priority queue by step.
+
+    The agents woken at the same step are updated in their list order, as
+    in the per step loop, so the random choices of the agents are the same.
+    """
+
+    def __init__(self, agents, step=1, update=None):
+        """The agents and the queue of their updates. [("step","index","agent")]
+
+        update(agent, step) runs the update of an agent, by default agent.update(step).
+        """
+        self.agents = agents
+        self.run = update or (lambda agent, step: agent.update(step))
+        self.queue = [(step, index, agent) for index, agent in enumerate(agents)]
+        heapq.heapify(self.queue)
+
+        """True if some agent can skip steps, otherwise the queue is not used. """
+        self.sleeping = any(agent.can_sleep() for agent in agents)
+
+        """The number of agent updates run and skipped. """
+        self.updates = 0
+        self.skipped = 0
+
+    def update(self, step):
+        """Updates the agents that have work at this step, and schedules their next update."""
+        if not self.sleeping:
+            # Every agent has work at every step, the queue would only cost
+            for agent in self.agents:
+                self.run(agent, step)
+            self.updates += len(self.agents)
+            return
+
+        queue = self.queue
+        woken = []
+        while queue and queue[0][0] <= step:
+            woken.append(heapq.heappop(queue))
+        for _, index, agent in woken:
+            self.run(agent, step)
+            heapq.heappush(queue, (agent.next_update(step), index, agent))
+        self.updates += len(woken)
+        self.skipped += len(self.agents) - len(woken)
+
+    def __str__(self):
+        return "Agent updates: run=%d skipped=%d" % (self.updates, self.skipped)
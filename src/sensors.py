@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Sensors used by the agents to observe the lanes and traffic lights of the simulation.
+"""
+
+from backend import traci, constants as tc
+
+class LaneSensor(object):
+    """Reads the lane and traffic light measures straight from TraCI, one request for each value.
+    """
+
+    """True if the lane measures are aggregated by SUMO over a period,
+    so they must be read only when an agent is about to act.
+    """
+    aggregated = False
+
+    def subscribe(self, lanes):
+        """Prepares the sensor to observe the given lanes.
+
+        Polling needs no preparation, so there is nothing to do here.
+        """
+        pass
+
+    def subscribe_traffic_light(self, tls_id):
+        """Prepares the sensor to observe the given traffic light."""
+        pass
+
+    def halting_number(self, lane_id):
+        """Number of halting vehicles in the lane at the last step."""
+        return traci.lane.getLastStepHaltingNumber(lane_id)
+
+    def occupancy(self, lane_id):
+        """Occupancy of the lane at the last step."""
+        return traci.lane.getLastStepOccupancy(lane_id)
+
+    def vehicle_number(self, lane_id):
+        """Number of vehicles in the lane at the last step."""
+        return traci.lane.getLastStepVehicleNumber(lane_id)
+
+    def phase(self, tls_id):
+        """Index of the phase running on the traffic light."""
+        return traci.trafficlights.getPhase(tls_id)
+
+class SubscriptionLaneSensor(LaneSensor):
+    """Reads the lane measures from TraCI variable subscriptions.
+
+    SUMO sends the values of all subscribed lanes in the response of
+    traci.simulationStep(), so reading them costs no extra round trip.
+    A single instance can be shared by all agents, each lane is
+    subscribed only once.
+    """
+
+    """The lane variables sent by SUMO at each step. """
+    VARIABLES = (tc.LAST_STEP_VEHICLE_HALTING_NUMBER,
+                 tc.LAST_STEP_OCCUPANCY,
+                 tc.LAST_STEP_VEHICLE_NUMBER)
+
+    """The traffic light variables sent by SUMO at each step. """
+    TRAFFIC_LIGHT_VARIABLES = (tc.TL_CURRENT_PHASE,)
+
+    def __init__(self):
+        """Keeps the lanes and traffic lights already subscribed. """
+        self.subscribed = set()
+        self.subscribed_traffic_lights = set()
+
+    def subscribe(self, lanes):
+        """Subscribes the lane variables for the lanes not yet subscribed.
+        """
+        for lane_id in set(lanes).difference(self.subscribed):
+            traci.lane.subscribe(lane_id, self.VARIABLES)
+            self.subscribed.add(lane_id)
+
+    def subscribe_traffic_light(self, tls_id):
+        """Subscribes the traffic light variables, if not yet subscribed.
+        """
+        if tls_id not in self.subscribed_traffic_lights:
+            traci.trafficlights.subscribe(tls_id, self.TRAFFIC_LIGHT_VARIABLES)
+            self.subscribed_traffic_lights.add(tls_id)
+
+    def halting_number(self, lane_id):
+        return traci.lane.getSubscriptionResults(lane_id)[tc.LAST_STEP_VEHICLE_HALTING_NUMBER]
+
+    def occupancy(self, lane_id):
+        return traci.lane.getSubscriptionResults(lane_id)[tc.LAST_STEP_OCCUPANCY]
+
+    def vehicle_number(self, lane_id):
+        return traci.lane.getSubscriptionResults(lane_id)[tc.LAST_STEP_VEHICLE_NUMBER]
+
+    def phase(self, tls_id):
+        return traci.trafficlights.getSubscriptionResults(tls_id)[tc.TL_CURRENT_PHASE]
+
+class DetectorSensor(LaneSensor):
+    """Reads the lane measures from SUMO lane-area(E2) detectors.
+
+    SUMO aggregates the occupancy over the detector period, so one read
+    replaces the samples of every step of the period. TraCI gives no mean
+    of the halting and vehicle numbers over the period, so these are the
+    values of the step of the read, the last step of the period. Only the
+    occupancy is used by the agents decisions, the other measures are kept
+    in their histories. Each lane is read through the first detector placed
+    on it, either defined by the scenario or written by
+    detectors.write_detectors.
+    """
+
+    aggregated = True
+
+    """The interval reads of the detectors, that only recent TraCI clients have. """
+    INTERVAL_FUNCTIONS = ("getLastIntervalOccupancy",)
+
+    def __init__(self):
+        """The detector of each lane. {"lane":"detector"} """
+        self.detectors = None
+
+    def subscribe(self, lanes):
+        """Finds the detectors placed on the lanes.
+
+        Raises a ValueError if the TraCI client can not read the detectors
+        intervals, or if some lane has no detector.
+        """
+        if self.detectors is None:
+            lanearea = getattr(traci, "lanearea", None)
+            missing = [name for name in self.INTERVAL_FUNCTIONS if not hasattr(lanearea, name)]
+            if missing:
+                raise ValueError("The TraCI client has no lanearea.%s, the detectors mode needs "
+                                 "a SUMO release whose lane-area detectors give their last interval."
+                                 % ", lanearea.".join(missing))
+            self.detectors = dict()
+            for detector_id in sorted(traci.lanearea.getIDList()):
+                self.detectors.setdefault(traci.lanearea.getLaneID(detector_id), detector_id)
+
+        missing = set(lanes).difference(self.detectors)
+        if missing:
+            raise ValueError("There is no lane-area detector on the lanes: %s."
+                             % ";".join(sorted(missing)))
+
+    def halting_number(self, lane_id):
+        """Number of halting vehicles on the detector at the step of the read."""
+        return traci.lanearea.getLastStepHaltingNumber(self.detectors[lane_id])
+
+    def occupancy(self, lane_id):
+        """Mean occupancy of the lane in the last detector period, in [0,1]."""
+        return traci.lanearea.getLastIntervalOccupancy(self.detectors[lane_id]) / 100.0
+
+    def vehicle_number(self, lane_id):
+        """Number of vehicles on the detector at the step of the read."""
+        return traci.lanearea.getLastStepVehicleNumber(self.detectors[lane_id])
+
+class SensorHub(object):
+    """Keeps the lane and traffic light measures of the whole network for the current step.
+
+    The agents subscribe their lanes to the hub, that builds the union of
+    them. Then, once per step, the hub reads each distinct lane through its
+    sensor and the agents read the kept values, so the TraCI traffic grows
+    with the number of lanes and not with the number of agents and links.
+    The running phase of a traffic light is read on demand, at most once per
+    step and only for the traffic lights whose agents or actuations read it
+    at that step. With an aggregated sensor the lanes are also read on
+    demand, at most once per step.
+    """
+
+    def __init__(self, sensor=None):
+        """The sensor that reads the lanes, by default polls TraCI. """
+        self.sensor = sensor or LaneSensor()
+        self.aggregated = self.sensor.aggregated
+
+        """The union of the lanes of all agents. """
+        self.lanes = set()
+
+        """The lanes measures at the current step. {"lane":"value"} """
+        self.halting_numbers = dict()
+        self.occupancies = dict()
+        self.vehicle_numbers = dict()
+
+        """The observed traffic lights and the phases already read at the current step. {"tls":"value"} """
+        self.traffic_lights = set()
+        self.phases = dict()
+
+    def subscribe(self, lanes):
+        """Adds the lanes not yet known to the observed ones.
+        """
+        lanes = set(lanes).difference(self.lanes)
+        self.sensor.subscribe(lanes)
+        self.lanes.update(lanes)
+
+    def subscribe_traffic_light(self, tls_id):
+        """Adds the traffic light to the observed ones.
+        """
+        if tls_id not in self.traffic_lights:
+            self.sensor.subscribe_traffic_light(tls_id)
+            self.traffic_lights.add(tls_id)
+
+    def update(self):
+        """Reads the measures of all lanes, it must be called after each simulation step.
+        """
+        if self.aggregated:
+            # The aggregated measures are read on demand, only by the agents about to act
+            self.halting_numbers.clear()
+            self.occupancies.clear()
+            self.vehicle_numbers.clear()
+        else:
+            for lane_id in self.lanes:
+                self.halting_numbers[lane_id] = self.sensor.halting_number(lane_id)
+                self.occupancies[lane_id] = self.sensor.occupancy(lane_id)
+                self.vehicle_numbers[lane_id] = self.sensor.vehicle_number(lane_id)
+        # The phases are read on demand, most agents read them only when they act
+        self.phases.clear()
+
+    def halting_number(self, lane_id):
+        if lane_id not in self.halting_numbers:
+            self.halting_numbers[lane_id] = self.sensor.halting_number(lane_id)
+        return self.halting_numbers[lane_id]
+
+    def occupancy(self, lane_id):
+        if lane_id not in self.occupancies:
+            self.occupancies[lane_id] = self.sensor.occupancy(lane_id)
+        return self.occupancies[lane_id]
+
+    def vehicle_number(self, lane_id):
+        if lane_id not in self.vehicle_numbers:
+            self.vehicle_numbers[lane_id] = self.sensor.vehicle_number(lane_id)
+        return self.vehicle_numbers[lane_id]
+
+    def phase(self, tls_id):
+        if tls_id not in self.phases:
+            self.phases[tls_id] = self.sensor.phase(tls_id)
+        return self.phases[tls_id]
+
+    def snapshot(self):
+        """Returns a copy of the measures of the current step, that is kept while the hub reads the next steps.
+
+        The snapshot makes no TraCI call, so the phases of all observed
+        traffic lights are read before the copy.
+        """
+        for tls_id in self.traffic_lights:
+            self.phase(tls_id)
+        return SensorSnapshot(self)
+
+class SensorSnapshot(object):
+    """The lane and traffic light measures kept by a hub at a step.
+
+    Only the measures already read are kept, so the hub sensor must not be
+    aggregated, and the snapshot makes no TraCI call.
+    """
+
+    def __init__(self, hub):
+        self.aggregated = hub.aggregated
+
+        """The lanes and traffic lights measures at the step. {"lane":"value"} """
+        self.halting_numbers = dict(hub.halting_numbers)
+        self.occupancies = dict(hub.occupancies)
+        self.vehicle_numbers = dict(hub.vehicle_numbers)
+        self.phases = dict(hub.phases)
+
+    def halting_number(self, lane_id):
+        return self.halting_numbers[lane_id]
+
+    def occupancy(self, lane_id):
+        return self.occupancies[lane_id]
+
+    def vehicle_number(self, lane_id):
+        return self.vehicle_numbers[lane_id]
+
+    def phase(self, tls_id):
+        return self.phases[tls_id]
@@ -7,14 +7,36 @@ copy of the file Sumo/Controle Semaforico/QLearning/tlcontrol/tlutils.py
 """
 
 from collections import deque
-import traci
+from itertools import izip
+from copy import deepcopy
+import backend
+from backend import traci
 
 # Export the utility classes
-__all__ = ['Lane', 'Program', 'Phase']
+__all__ = ['Lane', 'Program', 'Phase', 'Plan', 'PlanPool']
 
 
 VEHICLE_LENGTH = 5.0
 
+"""The controlled lanes tuples and the green lanes of each phase definition,
+shared by the phases of all programs. {"lanes":"lanes"} {("lanes","definition"):"green lanes"} """
+LANES = dict()
+GREEN_LANES = dict()
+
+def intern_lanes(lanes):
+    """Returns the shared tuple of the given controlled lanes."""
+    lanes = tuple(lanes)
+    return LANES.setdefault(lanes, lanes)
+
+def green_lanes_of(lanes, definition):
+    """Returns the shared tuple of the lanes with green light in the phase definition."""
+    key = (lanes, definition)
+    green_lanes = GREEN_LANES.get(key)
+    if green_lanes is None:
+        # The empty lanes of link indexes without links are never green
+        green_lanes = tuple(set(l for l, s in zip(lanes, definition) if s in "gG" and l))
+        green_lanes = GREEN_LANES.setdefault(key, green_lanes)
+    return green_lanes
 
 def bounded(num, lower, upper):
     """Returns a num if it is in [lower, upper], or the closest extreme."""
@@ -159,13 +181,19 @@ class Lane(object):
         self.__speed_window.add_point(speed)
 
 
-class Program(traci.trafficlights.Logic, object):
+class Program(backend.Logic, object):
     """Represents a sequence of phases, with their own duration.
 
-    Since this is a subclass of traci.trafficlights.Logic,
+    Since this is a subclass of backend.Logic,
     it can be used with methods from traci.trafficlights.
+    The actuators send its TraCI data, given by to_sumo().
+
+    The cycle time, green time and time portions of the phases are cached,
+    the phases clear the cache when their duration changes.
     """
 
+    __slots__ = ("__lanes", "__times")
+
     @staticmethod
     def from_sumo(program, lanes):
         """Create a program from data straight from TraCI."""
@@ -177,9 +205,39 @@ class Program(traci.trafficlights.Logic, object):
         super(Program, self).__init__(id, type, sub_parameter,
                                            current_phase_index, phases)
         try:
-            self.__lanes = phases[0].state.keys()
+            self.__lanes = phases[0].lanes
         except IndexError:
-            self.__lanes = []
+            self.__lanes = ()
+        self.adopt_phases()
+
+    def adopt_phases(self):
+        """Makes the phases clear the times of this program when changed."""
+        for phase in self._phases:
+            phase.program = self
+        self.clear_times()
+
+    def clear_times(self):
+        """Clears the cached times, after a change of the phases durations."""
+        self.__times = None
+
+    def times(self):
+        """The cached (cycle time, green time, time portion of each phase)."""
+        if self.__times is None:
+            cycle_time = 0
+            green_time = 0
+            for phase in self._phases:
+                cycle_time += phase.duration
+                if phase.has_green:
+                    green_time += phase.duration
+            portions = []
+            for phase in self._phases:
+                try:
+                    portions.append(float(phase.duration if phase.has_green else 0)/float(cycle_time))
+                #Keeps the time_portion as zero
+                except ZeroDivisionError:
+                    portions.append(0)
+            self.__times = (cycle_time, green_time, portions)
+        return self.__times
 
     @property
     def id(self):
@@ -200,6 +258,7 @@ class Program(traci.trafficlights.Logic, object):
     @phases.setter
     def phases(self, val):
         self._phases = val
+        self.adopt_phases()
 
     @property
     def current_phase_index(self):
@@ -282,34 +341,20 @@ class Program(traci.trafficlights.Logic, object):
     def phase_cycle_time(self):
         """The cycle time of the program.
         """
-        cycle_time = 0
-        for phase in self.phases:
-            cycle_time += phase.duration
-        return cycle_time
+        return self.times()[0]
 
-    def phase_time_portion(self, phase_index=None):
-        """Proportion of time used by the current phase in the cycle.
+    def phase_green_time(self):
+        """The time of the phases with green lanes in the cycle.
         """
-        time_portion = 0
-        cycle_time = self.phase_cycle_time()
-        current_phase_duration = 0
-
-        if phase_index in range(len(self.phases)):
-            current_phase = self.phases[phase_index]
-        else:
-            current_phase = self.current_phase
-
-        if current_phase.has_green:
-            current_phase_duration = current_phase.duration
+        return self.times()[1]
 
-        try:
-            time_portion = float(current_phase_duration)/float(cycle_time)
-
-        #Keeps the time_portion as zero
-        except ZeroDivisionError:
-            time_portion = 0
-
-        return time_portion
+    def phase_time_portion(self, phase_index=None):
+        """Proportion of time used by the given phase in the cycle, by default the current phase.
+        """
+        portions = self.times()[2]
+        if isinstance(phase_index, (int, long)) and 0 <= phase_index < len(portions):
+            return portions[phase_index]
+        return portions[self._currentPhaseIndex]
 
     def fill_with(self, from_sumo, lanes=None):
         """Fills with the given data from traci, and may change the controlled lanes."""
@@ -317,21 +362,72 @@ class Program(traci.trafficlights.Logic, object):
         self._type = from_sumo._type
         self._subParameter = from_sumo._subParameter
         self._currentPhaseIndex = from_sumo._currentPhaseIndex
-        self._phases = [Phase.from_sumo(data, lanes or self.__lanes)
+        if lanes is not None:
+            self.__lanes = intern_lanes(lanes)
+        self._phases = [Phase.from_sumo(data, self.__lanes)
                         for data in from_sumo._phases]
+        self.adopt_phases()
+
+    def switch_to(self, plan):
+        """Switches to the given plan, keeping the phases of this program.
+
+        When the plan has the same phase definitions, as the plans of a
+        traffic light always have, only its id, current phase index and
+        durations are copied, nothing is allocated. Otherwise the program
+        is filled with the plan. The plan may also be a Plan of the pool of
+        this traffic light.
+        """
+        phases = self._phases
+        if isinstance(plan, Plan):
+            if len(plan.durations) != len(phases):
+                raise ValueError("The plan %s has %d durations for %d phases."
+                                 % (plan.id, len(plan.durations), len(phases)))
+            self._subID = plan.id
+            self._currentPhaseIndex = plan.current_phase_index
+            for phase, duration in izip(phases, plan.durations):
+                phase._duration = duration
+            self.__times = None
+            return
+
+        plan_phases = plan._phases
+        if len(phases) != len(plan_phases):
+            return self.fill_with(plan)
+        for phase, plan_phase in izip(phases, plan_phases):
+            if phase._phaseDef != plan_phase._phaseDef:
+                return self.fill_with(plan)
+
+        self._subID = plan._subID
+        self._type = plan._type
+        self._subParameter = plan._subParameter
+        self._currentPhaseIndex = plan._currentPhaseIndex
+        for phase, plan_phase in izip(phases, plan_phases):
+            phase._duration = plan_phase._duration
+            phase._duration1 = plan_phase._duration1
+            phase._duration2 = plan_phase._duration2
+        self.__times = plan.__times if isinstance(plan, Program) else None
+
+    def to_sumo(self):
+        """The TraCI data of the program, a copy that is not changed by the agent."""
+        return backend.Logic(self._subID, self._type, self._subParameter, self._currentPhaseIndex,
+                             [backend.Phase(phase._duration, phase._duration1, phase._duration2, phase._phaseDef)
+                              for phase in self._phases])
 
     def __repr__(self):
         class_name = self.__class__.__module__ + '.' + self.__class__.__name__
         return ("<%s id=%s current_phase_index=%d phases=%s>"
                 % (class_name, self.id, self.current_phase_index, self.phases))
 
-class Phase(traci.trafficlights.Phase, object):
+class Phase(backend.Phase, object):
     """A configuration of green/yellow/red signs for all controlled lanes of a traffic light.
 
     A Phase also has a current duration, as well as a minimum and maximum value for it.
     This class may be used to group lanes by the phase in which they have a green light.
+    The controlled lanes and green lanes tuples are shared by the phases with the
+    same lanes and definition, the state of a lane is its char in the definition.
     """
 
+    __slots__ = ("__controlled_lanes", "__green_lanes", "__min_duration", "__max_duration", "program")
+
     DEFAULT_MIN =  15000 #20000
     DEFAULT_MAX = 120000
     DEFAULT_MIN_NOGREEN = 5000
@@ -357,6 +453,9 @@ class Phase(traci.trafficlights.Phase, object):
         """
         super(Phase, self).__init__(duration, 0, 0, state_string)
 
+        """The program whose cached times depend on this phase, or None. """
+        self.program = None
+
         if len(controlled_lanes) != len(state_string):
             raise ValueError("The list of controlled lanes and the state "
                              "string must have the same length.")
@@ -373,10 +472,15 @@ class Phase(traci.trafficlights.Phase, object):
                                                if self.has_green
                                                else self.DEFAULT_MAX_NOGREEN)
 
+    @property
+    def lanes(self):
+        """Tuple of the controlled lanes, in the order of the phase definition."""
+        return self.__controlled_lanes
+
     @property
     def state(self):
         """Dict from incoming lane ID to its current state (char from gGyYrR)."""
-        return self.__state
+        return dict(zip(self.__controlled_lanes, self._phaseDef))
 
     @property
     def has_green(self):
@@ -387,7 +491,7 @@ class Phase(traci.trafficlights.Phase, object):
     def green_lanes(self):
         """Tuple of incoming lanes with green light on this phase.
         """
-        return tuple(l for l in self.__green_lanes)
+        return self.__green_lanes
 
     @property
     def min_duration(self):
@@ -412,6 +516,8 @@ class Phase(traci.trafficlights.Phase, object):
     @duration.setter
     def duration(self, val):
         self._duration = bounded(val, self.min_duration, self.max_duration)
+        if self.program is not None:
+            self.program.clear_times()
 
     @property
     def has_max_duration(self):
@@ -427,22 +533,70 @@ class Phase(traci.trafficlights.Phase, object):
         """
 
         if lanes is not None:
-            self.__controlled_lanes = lanes
+            self.__controlled_lanes = intern_lanes(lanes)
         if len(self.__controlled_lanes) != len(from_sumo._phaseDef):
             raise ValueError("Length mismatch between controlled lanes "
                              "and phase definition.")
 
         self._duration = from_sumo._duration
+        if self.program is not None:
+            self.program.clear_times()
         self._duration1 = from_sumo._duration1
         self._duration2 = from_sumo._duration2
         self._phaseDef = from_sumo._phaseDef
 
-        lanes_and_states = zip(self.__controlled_lanes, from_sumo._phaseDef)
-        self.__state = dict(lanes_and_states)
-        self.__green_lanes = set(l for l, s in lanes_and_states if s in "gG")
+        self.__green_lanes = green_lanes_of(self.__controlled_lanes, self._phaseDef)
 
 
     def __repr__(self):
         class_name = self.__class__.__module__ + '.' + self.__class__.__name__
         return ("<%s green_lanes=%s duration=%dms>"
-                % (class_name, self.green_lanes, self.duration))
\ No newline at end of file
+                % (class_name, self.green_lanes, self.duration))
+
+class Plan(object):
+    """A candidate plan of a traffic light, the durations of the phases of its program.
+
+    The phases are the ones of the program of the traffic light, so a plan
+    keeps only its id, the phase to start in and its durations, a tuple shared
+    by the plans with the same durations. A program switches to it with
+    Program.switch_to().
+    """
+
+    __slots__ = ("id", "current_phase_index", "durations")
+
+    def __init__(self, id, durations, current_phase_index=0):
+        self.id = id
+        self.current_phase_index = current_phase_index
+        self.durations = durations
+
+    def __repr__(self):
+        class_name = self.__class__.__module__ + '.' + self.__class__.__name__
+        return ("<%s id=%s current_phase_index=%d durations=%s>"
+                % (class_name, self.id, self.current_phase_index, self.durations))
+
+class PlanPool(object):
+    """Creates the plans of a traffic light, sharing the phases of its program.
+
+    The plans are created from a program of the traffic light, usually a
+    working copy edited by the agent, and each distinct tuple of durations
+    is kept once.
+    """
+
+    def __init__(self, program):
+        """The program whose phases are shared by the plans, and its working copy. """
+        self.program = program
+        self.scratch = deepcopy(program)
+
+        """The durations of the plans, each distinct tuple kept once. {"durations":"durations"} """
+        self.durations = dict()
+
+    def plan(self, program, id=None):
+        """Returns a plan with the durations of the program, and with its id if none is given."""
+        durations = tuple(phase._duration for phase in program._phases)
+        durations = self.durations.setdefault(durations, durations)
+        return Plan(program.id if id is None else id, durations, program.current_phase_index)
+
+    def edit(self, plan=None):
+        """Returns the working copy, switched to the plan or to the shared program, to create a plan."""
+        self.scratch.switch_to(plan or self.program)
+        return self.scratch
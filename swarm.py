@@ -6,20 +6,35 @@ import os
 import sys
 from copy import copy, deepcopy
 import argparse
+import shlex
+import traceback
+import threading
+from Queue import Queue, Empty
 from time import time
 import pickle
-from random import random
+from random import random, seed as random_seed
 
 # Development libraries
 sys.path.append(os.path.join(os.getcwd(),os.path.dirname(__file__), 'src'))
 from learning_ant_agent import LearningAntAgent
 from learning_agent import LearningAgent
 from ant import Ant
+from sensors import LaneSensor, SubscriptionLaneSensor, DetectorSensor, SensorHub
+from detectors import write_detectors
+from agent import Agent
+from network import NetworkMetadata, load_metadata
+from profiler import TraciProfiler
+from actuators import BatchActuator
+from scheduler import Scheduler
+from colony import ColonyEngine
+from pipeline import PipelinedSensor, Pipeline, DecisionLog
+from partition import partition, Coordinator
+from fake_traci import FakeManager, FakeClient
+from backend import traci, select_backend, BACKENDS
+from replay import RecordingBackend, ReplayBackend, ReplayDivergence, RECORDING_ERRORS
 from constants import *
-
-import traci
  
-def parse():
+def parse(args=None):
     """Read the input and put the words in a dictionary.
     """
 
@@ -28,11 +43,30 @@ def parse():
     # Simulation configuration group
     groupSim = parser.add_argument_group("Simulation group","The parameters that define the basics of simulation execution.")
     groupSim.add_argument(MIN_PORT, PORT, dest=PORT, nargs=1, metavar="number", default=DEFAULT_PORT, help="Flag to inform the port to communicate with traci-hub or SUMO.")
+    groupSim.add_argument(MIN_BACKEND, BACKEND, dest=BACKEND, nargs=1, choices=BACKENDS, default=DEFAULT_BACKEND, help="The implementation of the TraCI calls: the socket client(traci), SUMO inside this process(libsumo) or a pure Python network without SUMO(fake).")
+    groupSim.add_argument(MIN_SUMO_CONFIG, SUMO_CONFIG, dest=SUMO_CONFIG, nargs=1, metavar="file-path", default=DEFAULT_SUMO_CONFIG, help="The SUMO configuration file, used to start the simulation with the libsumo backend.")
+    groupSim.add_argument(MIN_RECORD, RECORD, dest=RECORD, nargs=1, metavar="file-path", default=DEFAULT_RECORD, help="Records every TraCI request and response of the execution to this file, to be replayed without the simulator.")
+    groupSim.add_argument(MIN_REPLAY, REPLAY, dest=REPLAY, nargs=1, metavar="file-path", default=DEFAULT_REPLAY, help="Answers the TraCI requests from a recorded execution instead of a backend, and stops if the agents diverge from it.")
+    groupSim.add_argument(MIN_SEED, SEED, dest=SEED, nargs=1, metavar="number", default=DEFAULT_SEED, help="The seed of the agents random choices. A recording keeps its seed, that is used by the replay when none is given.")
+    groupSim.add_argument(MIN_SUBSCRIPTION, SUBSCRIPTION, dest=SUBSCRIPTION, action="store_true", default=DEFAULT_SUBSCRIPTION, help="Read the lanes measures from TraCI variable subscriptions, all of them arrive in the response of each simulation step.")
+    groupSim.add_argument(MIN_DETECTORS, DETECTORS, dest=DETECTORS, action="store_true", default=DEFAULT_DETECTORS, help="Read the lanes measures from lane-area(E2) detectors, read only when an agent is about to act. The occupancy is aggregated by SUMO over the detector period, the halting and vehicle numbers are the ones of the step of the read. Needs a SUMO release whose lane-area detectors give their last interval.")
+    groupSim.add_argument(MIN_WRITE_DETECTORS, WRITE_DETECTORS, dest=WRITE_DETECTORS, nargs=1, metavar="file-path", default=DEFAULT_WRITE_DETECTORS, help="Writes the SUMO additional file with the lane-area detectors used by the detectors sensing mode, and exits. Requires the network file.")
+    groupSim.add_argument(MIN_NET_FILE, NET_FILE, dest=NET_FILE, nargs=1, metavar="file-path", default=DEFAULT_NET_FILE, help="The SUMO network file, the traffic lights metadata is read from it without TraCI and cached by its hash.")
+    groupSim.add_argument(MIN_METADATA_CACHE, METADATA_CACHE, dest=METADATA_CACHE, nargs=1, metavar="dir-path", default=DEFAULT_METADATA_CACHE, help="The directory that keeps the static network metadata(lanes, lengths, links and programs) between executions. Used only with a network file.")
+    groupSim.add_argument(MIN_OUTPUT_DIR, OUTPUT_DIR, dest=OUTPUT_DIR, nargs=1, metavar="dir-path", default=DEFAULT_OUTPUT_DIR, help="The directory of the execution log.")
+    groupSim.add_argument(MIN_SWEEP, SWEEP, dest=SWEEP, nargs=1, metavar="file-path", default=DEFAULT_SWEEP, help="Runs at once the executions listed in this file, a line of arguments for each one, in threads of this process. Each one needs its own simulation, e.g. its own SUMO port, and writes its log to its output directory, by default run-<line number>. A line can not run a sweep, partitions, libsumo or the TraCI profile.")
+    groupSim.add_argument(MIN_SWEEP_THREADS, SWEEP_THREADS, dest=SWEEP_THREADS, nargs=1, metavar="number", default=DEFAULT_SWEEP_THREADS, help="The number of executions of the sweep that run at once, zero for all of them. A [0,infinite) value.")
+    groupSim.add_argument(MIN_PARTITIONS, PARTITIONS, dest=PARTITIONS, nargs=1, metavar="number", default=DEFAULT_PARTITIONS, help="Splits the traffic lights in this number of parts of neighbours, each one controlled by its own process and TraCI connection. SUMO must accept this number of clients(--num-clients), and its TraCI client must have setOrder() and the trafficlights domain. A [1,infinite) value.")
+    groupSim.add_argument(MIN_PIPELINE_LAG, PIPELINE_LAG, dest=PIPELINE_LAG, nargs=1, metavar="number", default=DEFAULT_PIPELINE_LAG, help="Pipelined mode, the agents decide on the measures of a step while SUMO runs the next one, and the decisions are sent this number of steps later. Zero for the serial mode. A [0,infinite) value.")
+    groupSim.add_argument(MIN_DECISION_LOG, DECISION_LOG, dest=DECISION_LOG, nargs=1, metavar="file-path", default=DEFAULT_DECISION_LOG, help="Saves the programs pushed by the agents, by the step of their measures, to be compared with other executions.")
+    groupSim.add_argument(MIN_COMPARE_DECISIONS, COMPARE_DECISIONS, dest=COMPARE_DECISIONS, nargs=1, metavar="file-path", default=DEFAULT_COMPARE_DECISIONS, help="Reports how much the decisions of this execution differ from the ones saved by a previous one, e.g. a pipelined execution against a serial one.")
+    groupSim.add_argument(MIN_TRACI_PROFILE, TRACI_PROFILE, dest=TRACI_PROFILE, nargs=1, metavar="file-path", default=DEFAULT_TRACI_PROFILE, help="Counts and times the TraCI calls by method, agent and step, and writes the report of the top calls to this file.")
 
     # Swarm configuration group
     groupSwarm = parser.add_argument_group("Swarm configuration group","The parameters that define the properties for the Swarm algorithm.")
     groupSwarm.add_argument(MIN_BETA, BETA, MIN_EVAPORATION_RATE, EVAPORATION_RATE, dest=EVAPORATION_RATE, nargs=1, metavar="number", default=DEFAULT_EVAPORATION_RATE, help="The evaporation rate of pheromone.")
     groupSwarm.add_argument(MIN_THETA, THETA, MIN_RESPONSE_THRESHOLD, RESPONSE_THRESHOLD, dest=RESPONSE_THRESHOLD, nargs=1, metavar="number", default=DEFAULT_RESPONSE_THRESHOLD, help="The response threshold for a plan change for an ant.")
+    groupSwarm.add_argument(MIN_COLONY_ENGINE, COLONY_ENGINE, dest=COLONY_ENGINE, action="store_true", default=DEFAULT_COLONY_ENGINE, help="Computes the pheromone of all ants at once, with NumPy, before their updates at each step. Runs only in the serial mode, with the lanes sampled at every step.")
 
     # Learning configuration group
     groupLearning = parser.add_argument_group("Learning configuration group","The parameters that define the properties for the Learning algorithm.")
@@ -47,12 +81,12 @@ def parse():
 
     # Hybrid configuration group
     groupHybrid = parser.add_argument_group("Hybrid configuration group","The parameters that define the properties for the Hybrid algorithm.")
-    groupHybrid.add_argument(MIN_MEMORY_WINDOW, MEMORY_WINDOW, dest=MEMORY_WINDOW, nargs=1, metavar="number", default=DEFAULT_MEMORY_WINDOW, help="The size of memory of each traffic lights, i.e. the number of memorized plans. A [1,infinite) value.")
+    groupHybrid.add_argument(MIN_MEMORY_WINDOW, MEMORY_WINDOW, dest=MEMORY_WINDOW, nargs=1, metavar="number", default=DEFAULT_MEMORY_WINDOW, help="The size of memory of each traffic lights, i.e. the number of memorized plans. A [1,infinite) value. In the detectors sensing mode it keeps one sample for each action, so the memory holds the actions made in this number of steps, at least one.")
     #groupHybrid.add_argument(MIN_MEMORY_LOSS_FACTOR, MEMORY_LOSS_FACTOR, dest=MEMORY_LOSS_FACTOR, nargs=1, metavar="number", default=DEFAULT_MEMORY_LOSS_FACTOR, help="The time memory for acquired plans, i.e. the time in steps for the plan be forgotten. A [0,infinite) value.")
     groupHybrid.add_argument(MIN_MEMORY_LOSS_FACTOR, MEMORY_LOSS_FACTOR, dest=MEMORY_LOSS_FACTOR, nargs=1, metavar="number", default=DEFAULT_MEMORY_LOSS_FACTOR, help="A factor that is applied to the model quality simulating the loss of memory of the agent. A [0,1] value.")
     groupHybrid.add_argument(MIN_RHO, RHO, dest=RHO, nargs=1, metavar="number", default=DEFAULT_RHO, help="This parameter is an adjustment coefficient for the model’s quality.")
     groupHybrid.add_argument(MIN_OMEGA, OMEGA, dest=OMEGA, nargs=1, metavar="number", default=DEFAULT_OMEGA, help="This parameter specifies the relative importance of rewards and transitions for the model’s quality.")
-    args = parser.parse_args()
+    args = parser.parse_args(args)
     params = vars(args)
 
     #"""
@@ -70,16 +104,149 @@ def main():
     # Parse the input command.
     params = parse()
 
-    # For the use of SUMO with traci-hub.
-    port = int(params[PORT].pop()) 
-    if port >= 0:
-        traci.init(port)
+    # Runs many executions at once, each one with its own arguments.
+    if params.has_key(SWEEP):
+        sweep(params[SWEEP].pop(), int(params[SWEEP_THREADS].pop()))
+        exit()
+
+    run(params)
+    exit()
+
+def sweep(path, threads):
+    """Runs the executions listed in the file, a line of arguments for each one, in threads of this process.
+
+    Each execution drives its own simulation through its own connection, and
+    the threads waiting for their simulation let the others run. The results
+    of each execution are written as in a single one, in its output directory,
+    by default run-<line number>.
+    """
+    runs = Queue()
+    with open(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            params = parse(shlex.split(line))
+            if params.has_key(SWEEP) or int(params[PARTITIONS][0]) > 1 or params[BACKEND][0] == "libsumo":
+                print "Error: The line "+str(number)+" of the sweep file runs a sweep, partitions or libsumo, that need a process of their own."
+                exit(1)
+            # The profiler wraps the TraCI functions shared by all threads
+            if params.has_key(TRACI_PROFILE):
+                print "Error: The line "+str(number)+" of the sweep file profiles the TraCI calls, that would count the calls of the other threads."
+                exit(1)
+            if params[OUTPUT_DIR][0] == DEFAULT_OUTPUT_DIR:
+                params[OUTPUT_DIR] = ["run-"+str(number)]
+            runs.put((number, params))
+
+    results = []
+    def work():
+        while True:
+            # Another thread may take the last run between a check and a get
+            try:
+                number, params = runs.get_nowait()
+            except Empty:
+                return
+            output = params[OUTPUT_DIR][0]
+            start = time()
+            try:
+                run(params, verbose=False)
+                results.append((number, output, time() - start, None))
+            except SystemExit as message:
+                # The executions end with exit(), that is a failure only with a code
+                results.append((number, output, time() - start, "exit "+str(message.code) if message.code else None))
+            except Exception:
+                results.append((number, output, time() - start, traceback.format_exc()))
+
+    workers = [threading.Thread(target=work, name="run-"+str(index))
+               for index in range(max(1, min(threads or runs.qsize(), runs.qsize())))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    print "\nSweep of "+str(len(results))+" executions in "+str(len(workers))+" threads"
+    for number, output, time_diff, error in sorted(results):
+        if error is None:
+            print "Line %d: %s done in %.3f s" % (number, output, time_diff)
+        else:
+            print "Line %d: %s failed in %.3f s: %s" % (number, output, time_diff, error)
+
+def run(params, verbose=True):
+    """Runs one execution with the parsed parameters.
+
+    When it is not verbose, the progress is not shown and the execution may
+    run in a thread, beside others: the seed is not used, as the agents of
+    all threads share the random choices.
+    """
+    # For the use of SUMO with traci-hub, the in process backends do not use the port.
+    port = int(params[PORT].pop())
+    if port < 0:
+        port = DEFAULT_PORT
+
+    # Selects the implementation of the TraCI calls.
+    seed = int(params[SEED].pop()) if params.has_key(SEED) else None
+    if not verbose and seed is not None:
+        print "Warning: The seed is not used in a sweep."
+        seed = None
+    backend = params[BACKEND].pop()
+    if params.has_key(REPLAY):
+        try:
+            replay = ReplayBackend(params[REPLAY].pop())
+        except RECORDING_ERRORS + (ValueError,) as message:
+            print "Error: Failed to open the recording."
+            print "\nMessage: ", message
+            exit(1)
+        traci.select(replay)
+        if seed is None:
+            seed = replay.seed
     else:
-        traci.init(DEFAULT_PORT)
+        try:
+            # Beside other executions, the socket client needs a connection of its own
+            select_backend(backend, params[SUMO_CONFIG].pop() if params.has_key(SUMO_CONFIG) else None,
+                           None if verbose or backend != "traci" else port)
+        except (ImportError, ValueError) as message:
+            print "Error: Failed to load the "+backend+" backend."
+            print "\nMessage: ", message
+            exit(1)
+        if params.has_key(RECORD):
+            # The replay needs the same random choices of the agents
+            if seed is None and verbose:
+                seed = int(time() * 1000) % 2**31
+            traci.select(RecordingBackend(traci.selected(), params[RECORD].pop(), seed))
+    if seed is not None:
+        random_seed(seed)
+
+    output = params[OUTPUT_DIR].pop()
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    # Accounts the TraCI calls of the whole execution.
+    if params.has_key(TRACI_PROFILE):
+        profiler = TraciProfiler()
+        profiler.install()
+    else:
+        profiler = None
+
+    # The static data of the network. When the network file is known it is
+    # read from the file, or its cache, before connecting to SUMO.
+    mc = params[METADATA_CACHE].pop()
+    if params.has_key(NET_FILE):
+        metadata = load_metadata(params[NET_FILE].pop(), mc)
+    else:
+        metadata = None
+
+    # Places the detectors for the next executions, SUMO must load them at launch.
+    if params.has_key(WRITE_DETECTORS):
+        if metadata is None:
+            print "Error: The network file is required to write the detectors."
+            exit(1)
+        write_detectors(metadata, params[WRITE_DETECTORS].pop(), Agent.COUNT_TO_ACTUATE)
+        exit()
 
     # Swarm
     er = float(params[EVAPORATION_RATE].pop())
     rt = float(params[RESPONSE_THRESHOLD].pop())
+    colony = params[COLONY_ENGINE].pop()
 
     # Learning
     lr = float(params[LEARNING_RATE].pop())
@@ -96,7 +263,7 @@ def main():
     r = float(params[RHO].pop())
     o = float(params[OMEGA].pop())
 
-    log = open("log.txt", "w+")
+    log = open(os.path.join(output, "log.txt"), "w+")
     log.write("Input Statistics\n")
     log.write("MEMORY_WINDOW: "+str(mw)+" EVAPORATION_RATE: "+str(er)+" RESPONSE_THRESHOLD: "+str(rt)+
               "\nLEARNING_RATE: "+str(lr)+" DISCOUNT_FACTOR: "+str(df)+" CURIOSITY: "+str(c)+
@@ -104,14 +271,9 @@ def main():
               "\nREWARD_EXPONENT: "+str(re)+" MEMORY_LOSS_FACTOR: "+str(ml)+" RHO: "+str(r)+
               "\nOMEGA: "+str(o)+"\n")
 
-    # Initializes the structure of ant system
-    #agents = [Ant(id=id, memory_window=mw, evaporation_rate=er, response_threshold=rt) for id in traci.trafficlights.getIDList()]
-    agents = [LearningAgent(id=id, memory_window=mw, learning_rate=lr, discount_factor=df, curiosity=c, curiosity_decay=cd, exploration_period=ep, qvalue=qv, reward_exponent=re, memory_loss_factor=ml) for id in traci.trafficlights.getIDList()]
-    #agents = [LearningAntAgent(id=id, memory_window=mw, evaporation_rate=er, response_threshold=rt, learning_rate=lr, discount_factor=df, curiosity=c, curiosity_decay=cd, exploration_period=ep, qvalue=qv, reward_exponent=re, memory_loss_factor=ml, omega=o, rho=r) for id in traci.trafficlights.getIDList()]
-    #print "LearningAntAgent List created"
-    
     # Open the input file that contains a list of qtables for each traffic lights
     # the data is converted to pickle object for compatibility.
+    qtables = None
     if params.has_key(BEST_QTABLE_FILE):
         bqf = params[BEST_QTABLE_FILE].pop()
         try:
@@ -123,13 +285,159 @@ def main():
                 # There is no pickle data at all in the file.
                 except EOFError:
                     qtables = []
-                # Load the qtable data for each traffic light
-                map(lambda agent: agent.load_qtable(qtables), agents)
         # There is no file to load
         except IOError as message:
             print "Warning: Failed to open best qtable input file."
             print "\nMessage: ", message
 
+    detectors = params[DETECTORS].pop()
+    subscription = params[SUBSCRIPTION].pop()
+    def create_sensor():
+        """The hub reads each lane once per step and shares its measures with all agents."""
+        if detectors:
+            return SensorHub(DetectorSensor())
+        elif subscription:
+            return SensorHub(SubscriptionLaneSensor())
+        return SensorHub(LaneSensor())
+
+    def create_agents(ids, sensor, actuator):
+        """Creates the agents of the traffic lights, and loads their qtables."""
+        # Initializes the structure of ant system
+        #agents = [Ant(id=id, memory_window=mw, evaporation_rate=er, response_threshold=rt, sensor=sensor, actuator=actuator, metadata=metadata[id]) for id in ids]
+        agents = [LearningAgent(id=id, memory_window=mw, learning_rate=lr, discount_factor=df, curiosity=c, curiosity_decay=cd, exploration_period=ep, qvalue=qv, reward_exponent=re, memory_loss_factor=ml, sensor=sensor, actuator=actuator, metadata=metadata[id]) for id in ids]
+        #agents = [LearningAntAgent(id=id, memory_window=mw, evaporation_rate=er, response_threshold=rt, learning_rate=lr, discount_factor=df, curiosity=c, curiosity_decay=cd, exploration_period=ep, qvalue=qv, reward_exponent=re, memory_loss_factor=ml, omega=o, rho=r, sensor=sensor, actuator=actuator, metadata=metadata[id]) for id in ids]
+        #print "LearningAntAgent List created"
+
+        # Load the qtable data for each traffic light
+        if qtables is not None:
+            map(lambda agent: agent.load_qtable(qtables), agents)
+        return agents
+
+    lag = int(params[PIPELINE_LAG].pop())
+
+    # Each part of the traffic lights is controlled by its own process and TraCI connection.
+    partitions = int(params[PARTITIONS].pop())
+    if colony and (partitions > 1 or lag > 0):
+        print "Error: The colony engine runs only in the serial mode, without partitions or pipeline."
+        exit(1)
+    if partitions > 1:
+        if backend not in ("traci", "fake") or params.has_key(RECORD) or params.has_key(REPLAY) or lag > 0 or profiler is not None:
+            print "Error: The partitioned mode runs only with the traci or fake backends, without record, replay, pipeline or profile."
+            exit(1)
+
+        # The order of the clients came with the SUMO releases that accept many of them
+        missing = [name for name in ("setOrder", "trafficlights") if not hasattr(traci, name)]
+        if backend == "traci" and missing:
+            print "Error: The partitioned mode needs a TraCI client with setOrder(), of a SUMO release that accepts many clients, that still has the trafficlights domain of the agents."
+            print "\nMessage: The TraCI client has no "+", ".join(missing)+"."
+            exit(1)
+
+        # The processes connect to SUMO, so the metadata is read from the network
+        # file, or from the fake network that is the same of the served one.
+        if metadata is None:
+            if backend != "fake":
+                print "Error: The network file is required in the partitioned mode."
+                exit(1)
+            metadata = NetworkMetadata.from_traci()
+
+        parts = partition(metadata, partitions)
+        if len(parts) < partitions:
+            print "Warning: The traffic lights fit in "+str(len(parts))+" partitions, SUMO must accept this number of clients."
+
+        if backend == "fake":
+            # A fake network served to the processes, as SUMO with many clients
+            manager = FakeManager()
+            manager.start()
+            server = manager.FakeServer(len(parts))
+        else:
+            manager = None
+
+        def connect(index):
+            """Opens the connection of the part, its commands run in the order of the part in each step."""
+            if manager is not None:
+                traci.select(FakeClient(server))
+            traci.init(port)
+            traci.setOrder(index + 1)
+
+        coordinator = Coordinator(parts, connect, create_sensor, create_agents, seed)
+        succeeded = coordinator.run()
+        if manager is not None:
+            manager.shutdown()
+        if not succeeded:
+            print "\nError:", coordinator.error
+            exit(1)
+
+        report = coordinator.report()
+        print "\nMessage:", report
+        log.write(report+"\n")
+        statistics = [data for data in coordinator.statistics]
+        if params.has_key(BEST_QTABLE_FILE):
+            with open(bqf,"w+") as f:
+                pickle.dump([qtable for data in statistics for qtable in data["qtables"]], f)
+        log.write("\n".join(agent for data in statistics for agent in data["agents"]))
+        log.close()
+        exit()
+
+    traci.init(port)
+
+    if metadata is None:
+        metadata = NetworkMetadata.from_traci()
+
+    # The hub reads each lane once per step and shares its measures with all agents.
+    sensor = create_sensor()
+
+    # The actuator sends the programs pushed by all agents at the end of each step.
+    actuator = BatchActuator(sensor)
+
+    # In the pipelined mode the agents read a snapshot of the hub, while it reads the next step.
+    if lag > 0:
+        try:
+            agent_sensor = PipelinedSensor(sensor)
+        except ValueError as message:
+            print "Error: Failed to start the pipelined mode."
+            print "\nMessage: ", message
+            exit(1)
+    else:
+        agent_sensor = sensor
+
+    try:
+        agents = create_agents(metadata.ids, agent_sensor, actuator)
+    except ValueError as message:
+        print "Error: Failed to read the lanes of the agents."
+        print "\nMessage: ", message
+        exit(1)
+
+    # The pheromone of all ants is computed at once, before their updates.
+    engine = None
+    if colony:
+        ants = [agent for agent in agents if isinstance(agent, Ant)]
+        try:
+            if ants:
+                engine = ColonyEngine(ants, agent_sensor)
+            else:
+                print "Warning: There is no ant agent for the colony engine."
+        except ImportError as message:
+            print "Warning: The ants compute their own pheromone."
+            print "\nMessage: ", message
+        except ValueError as message:
+            print "Error: Failed to start the colony engine."
+            print "\nMessage: ", message
+            exit(1)
+
+    # Keeps the decisions of the agents to compare the executions
+    if params.has_key(DECISION_LOG) or params.has_key(COMPARE_DECISIONS):
+        decision_log = DecisionLog()
+    else:
+        decision_log = None
+
+    if lag > 0:
+        pipeline = Pipeline(agents, agent_sensor, actuator, lag, decision_log)
+    else:
+        pipeline = None
+
+    # The agents are updated only at the steps in which they have work.
+    scheduler = Scheduler(agents, update=profiler.update_agent if profiler is not None else None)
+
     # For stop execution
     total_departed = 0
     total_arrived = 0
@@ -140,13 +448,13 @@ def main():
     while True:
 
         # Double of end flow time.
-        if time_step > 36000:
+        if time_step > STEPS_LIMIT:
             traci.close()
             print "\nMessage: traci closed for double time limit."
             break
 
         # All vehicles have arrived after the flow beginning.
-        if time_step > 3600 and total_arrived == total_departed:
+        if time_step > FLOW_STEPS and total_arrived == total_departed:
             traci.close()
             print "\nMessage: traci normally closed."
             break
@@ -155,25 +463,51 @@ def main():
             start = time()
             #Executes one step
             traci.simulationStep()
+            sensor.update()
 
             total_departed += traci.simulation.getDepartedNumber()
             total_arrived += traci.simulation.getArrivedNumber()
 
             # Executes the algorithm
             # Apply the update method to the agents
-            map(lambda agent: agent.update(time_step), agents)
+            if pipeline is not None:
+                # The agents make no TraCI call, so their updates are not profiled
+                pipeline.step(time_step)
+            else:
+                if engine is not None:
+                    engine.update(time_step)
+                scheduler.update(time_step)
+                if decision_log is not None:
+                    decision_log.record(time_step, actuator.pending, actuator)
+                actuator.flush()
 
             time_step += 1
             time_diff = time() - start
             time_total += time_diff
-            sys.stdout.write("\rTimestep #%d took %5.3f ms, Total %5.3f ms " % (time_step, time_diff, time_total))
-            sys.stdout.flush()
+            if verbose:
+                sys.stdout.write("\rTimestep #%d took %5.3f ms, Total %5.3f ms " % (time_step, time_diff, time_total))
+                sys.stdout.flush()
 
         except traci.FatalTraCIError as message:
             print "\nMessage:", message
             traci.close()
             break
 
+        except ReplayDivergence as message:
+            print "\nError:", message
+            exit(1)
+
+    if pipeline is not None:
+        pipeline.stop()
+
+    # Save the decisions and compare them with the ones of other execution
+    if params.has_key(DECISION_LOG):
+        decision_log.save(params[DECISION_LOG].pop())
+    if params.has_key(COMPARE_DECISIONS):
+        report = decision_log.compare(DecisionLog.load(params[COMPARE_DECISIONS].pop()))
+        print "\nMessage:", report
+        log.write(report+"\n")
+
     # Save the learning qtables, even if there is no input file.
     if params.has_key(BEST_QTABLE_FILE):
         with open(bqf,"w+") as f:
@@ -189,11 +523,18 @@ def main():
 #            # Converts the python list data in a pickle object to save at output file.
 #            pickle.dump(qtables, f)
 
+    print "\nMessage:", actuator
+    print "\nMessage:", scheduler
+    log.write(str(actuator)+"\n")
+
+    # Save the TraCI calls report
+    if profiler is not None:
+        profiler.save(params[TRACI_PROFILE].pop())
+
     # Save the log file
     log.write("\n".join(map(lambda agent: str(agent), agents)))
     #print "\n".join(map(lambda agent: str(agent), agents))
     log.close()
-    exit()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Compares the pheromone and stimuli of the colony engine with the ants own computation.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+import ant
+import colony
+from backend import traci
+from fake_traci import FakeTraci
+from sensors import LaneSensor, SensorHub
+from actuators import BatchActuator
+from colony import ColonyEngine
+
+def run_ants(memory_window, steps, engine):
+    """Runs the ants of the fake network, with or without the engine.
+
+    Returns the pheromone and stimulus of each ant after each step, and the ants.
+    """
+    traci.select(FakeTraci(size=2, seed=4))
+    traci.init()
+    hub = SensorHub(LaneSensor())
+    actuator = BatchActuator(hub)
+    ants = [ant.Ant(id=tls_id, memory_window=memory_window, evaporation_rate=0.5, response_threshold=0.5,
+                    sensor=hub, actuator=actuator)
+            for tls_id in traci.trafficlights.getIDList()]
+    colony_engine = ColonyEngine(ants, hub) if engine else None
+    states = []
+    for step in range(1, steps + 1):
+        traci.simulationStep()
+        hub.update()
+        if colony_engine is not None:
+            colony_engine.update(step)
+        for agent in ants:
+            agent.update(step)
+        actuator.flush()
+        # The stimulus is compared at every step, not only at the actions
+        states.append([(list(agent.pheromone_density), list(agent.pheromone_density_accumulated),
+                        list(agent.pheromone_accumulated_steps), agent.program_current_stimulus(),
+                        agent.program_current.id)
+                       for agent in ants])
+    traci.close()
+    return states, ants
+
+@unittest.skipIf(colony.numpy is None, "The colony engine requires NumPy.")
+class ColonyEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        # The ants take the last of the best plans, so both executions choose the same
+        self.choice = ant.choice
+        ant.choice = lambda plans: plans[-1]
+
+    def tearDown(self):
+        ant.choice = self.choice
+        traci.select(None)
+
+    def check_window(self, memory_window, steps):
+        states, ants = run_ants(memory_window, steps, False)
+        colony_states, colony_ants = run_ants(memory_window, steps, True)
+        self.assertTrue(colony_ants[0].colony is not None)
+        for step, (state, colony_state) in enumerate(zip(states, colony_states), 1):
+            self.assertEqual(colony_state, state, "The step %d differs." % step)
+        self.assertEqual([str(agent) for agent in colony_ants], [str(agent) for agent in ants])
+        # Some ant changed its plan, so the stimuli of other programs were compared
+        self.assertTrue(any(agent.program_current.id != "0" for agent in ants))
+
+    def test_window_of_seven_steps(self):
+        self.check_window(7, 800)
+
+    def test_window_of_thirty_seven_steps(self):
+        self.check_window(37, 800)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Runs the sensors, the actuator and an ant over the pure Python fake network.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from backend import traci, constants
+from fake_traci import FakeTraci
+from sensors import LaneSensor, SubscriptionLaneSensor, DetectorSensor, SensorHub
+from actuators import BatchActuator
+from ant import Ant
+from learning_agent import LearningAgent
+
+class FakeBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTraci(size=2, seed=1)
+        traci.select(self.fake)
+        traci.init()
+        self.tls_id = traci.trafficlights.getIDList()[0]
+
+    def tearDown(self):
+        traci.close()
+        traci.select(None)
+
+    def test_hub_reads_the_lanes_of_the_network(self):
+        hub = SensorHub(LaneSensor())
+        lanes = traci.trafficlights.getControlledLanes(self.tls_id)
+        hub.subscribe(lanes)
+        hub.subscribe_traffic_light(self.tls_id)
+        for step in range(1, 101):
+            traci.simulationStep()
+            hub.update()
+            for lane_id in lanes:
+                self.assertEqual(hub.occupancy(lane_id), self.fake.lane.getLastStepOccupancy(lane_id))
+                self.assertEqual(hub.halting_number(lane_id), self.fake.lane.getLastStepHaltingNumber(lane_id))
+            self.assertEqual(hub.phase(self.tls_id), self.fake.trafficlights.getPhase(self.tls_id))
+
+    def test_hub_reads_the_phases_on_demand(self):
+        calls = []
+        get_phase = self.fake.trafficlights.getPhase
+        def count(tls_id):
+            calls.append(tls_id)
+            return get_phase(tls_id)
+        self.fake.trafficlights.getPhase = count
+
+        hub = SensorHub(LaneSensor())
+        for tls_id in traci.trafficlights.getIDList():
+            hub.subscribe_traffic_light(tls_id)
+        for step in range(1, 51):
+            traci.simulationStep()
+            hub.update()
+        # No agent read a phase, so none was asked to TraCI
+        self.assertEqual(calls, [])
+
+        traci.simulationStep()
+        hub.update()
+        self.assertEqual(hub.phase(self.tls_id), hub.phase(self.tls_id))
+        self.assertEqual(calls, [self.tls_id])
+        # The snapshot keeps the phases of all traffic lights
+        self.assertEqual(sorted(hub.snapshot().phases), sorted(traci.trafficlights.getIDList()))
+
+    def test_subscriptions_read_the_same_values(self):
+        polled = SensorHub(LaneSensor())
+        subscribed = SensorHub(SubscriptionLaneSensor())
+        lanes = traci.trafficlights.getControlledLanes(self.tls_id)
+        for hub in (polled, subscribed):
+            hub.subscribe(lanes)
+            hub.subscribe_traffic_light(self.tls_id)
+        for step in range(1, 101):
+            traci.simulationStep()
+            polled.update()
+            subscribed.update()
+            self.assertEqual(polled.occupancies, subscribed.occupancies)
+            self.assertEqual(polled.halting_numbers, subscribed.halting_numbers)
+            self.assertEqual(polled.phase(self.tls_id), subscribed.phase(self.tls_id))
+        self.assertEqual(self.fake.lane.getSubscriptionResults(lanes[0])[constants.LAST_STEP_OCCUPANCY],
+                         self.fake.lane.getLastStepOccupancy(lanes[0]))
+
+    def count_calls(self, domain, name):
+        """Counts the calls to a function of a domain of the fake, by their argument."""
+        calls = []
+        function = getattr(domain, name)
+        def counted(object_id):
+            calls.append(object_id)
+            return function(object_id)
+        setattr(domain, name, counted)
+        return calls
+
+    def test_detectors_are_read_only_when_the_agents_act(self):
+        occupancy_calls = self.count_calls(self.fake.lanearea, "getLastIntervalOccupancy")
+        phase_calls = self.count_calls(self.fake.trafficlights, "getPhase")
+        hub = SensorHub(DetectorSensor())
+        actuator = BatchActuator(hub)
+        agents = [LearningAgent(id=tls_id, memory_window=500, learning_rate=0.5, discount_factor=0.9,
+                                curiosity=1, curiosity_decay=0.1, exploration_period=30, qvalue=0,
+                                reward_exponent=2, memory_loss_factor=0.5, sensor=hub, actuator=actuator)
+                  for tls_id in traci.trafficlights.getIDList()]
+        halting = dict()
+        samples = 0
+        for step in range(1, 1201):
+            traci.simulationStep()
+            hub.update()
+            for agent in agents:
+                agent.update(step)
+                if agent.memory_window and agent.memory_window[-1] == step:
+                    samples += len(set(agent.lanes))
+                    for lane_id in agent.lanes:
+                        halting[(step, lane_id)] = self.fake.lane.getLastStepHaltingNumber(lane_id)
+            actuator.flush()
+
+        # The window keeps an action in each period of the detectors
+        self.assertEqual(agents[0].memory_window.maxlen, agents[0].actions_window(500))
+        self.assertTrue(0 < samples < 1200)
+        self.assertEqual(len(occupancy_calls), samples)
+        # The phase is read only for the pushes of the actions
+        self.assertTrue(len(phase_calls) <= actuator.sent + actuator.skipped)
+        # The halting numbers are the ones of the step of the read, not a mean of the period
+        for agent in agents:
+            for lane_id in agent.lanes:
+                for step, value in agent.stopped_vehicles[lane_id].items():
+                    self.assertEqual(value, halting[(step, lane_id)])
+
+    def test_detectors_need_the_interval_reads(self):
+        # The detectors of an older TraCI client give no interval
+        self.fake.lanearea = object()
+        self.assertRaises(ValueError, DetectorSensor().subscribe, ())
+
+    def test_ant_acts_through_the_batch_actuator(self):
+        hub = SensorHub(LaneSensor())
+        actuator = BatchActuator(hub)
+        ants = [Ant(id=tls_id, memory_window=20, evaporation_rate=0.5, response_threshold=0.5,
+                    sensor=hub, actuator=actuator)
+                for tls_id in traci.trafficlights.getIDList()]
+        for step in range(1, 601):
+            traci.simulationStep()
+            hub.update()
+            for ant in ants:
+                ant.update(step)
+            actuator.flush()
+
+        self.assertTrue(actuator.sent > 0)
+        for ant in ants:
+            self.assertEqual(len(ant.memory_window), 20)
+            self.assertTrue(all(0 <= density <= 1 for density in ant.pheromone_density))
+            self.assertTrue(sum(ant.pheromone_accumulated_steps) > 0)
+            # The running program in the network is the one pushed by the ant
+            self.assertEqual(self.fake.trafficlights.getProgram(ant.id), ant.program_current.id)
+            logic = [logic for logic in self.fake.trafficlights.getCompleteRedYellowGreenDefinition(ant.id)
+                     if logic._subID == ant.program_current.id][0]
+            self.assertEqual([phase._duration for phase in logic._phases],
+                             [phase.duration for phase in ant.program_current.phases])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Compares the running sums and deviations of the histories with the samples of the window.
+"""
+
+import os
+import sys
+import unittest
+from math import sqrt
+from random import Random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from history import StepWindow, RingHistory
+
+def sample_deviation(samples):
+    """The two-pass sample standard deviation, 0 for less than two samples."""
+    if len(samples) < 2:
+        return 0
+    average = float(sum(samples)) / len(samples)
+    return sqrt(sum(pow(sample - average, 2) for sample in samples) / (len(samples) - 1))
+
+class RingHistoryTest(unittest.TestCase):
+
+    LANES = ("a_0", "b_0", "c_0")
+
+    def check_window(self, size, turns, scale, seed):
+        random = Random(seed)
+        clock = StepWindow(size)
+        history = RingHistory(self.LANES, clock, sums=True, deviations=True)
+        for step in range(1, size * turns + 1):
+            clock.append(step)
+            for lane_id in self.LANES:
+                # Rounded as the sampled occupancy, with long runs of the same value
+                value = 0 if random.random() < 0.3 else round(random.random() * scale, 6)
+                history[lane_id][step] = value
+                samples = history.window(lane_id).tolist()
+                self.assertEqual(len(samples), min(step, size))
+                self.assertAlmostEqual(history.window_average(lane_id), float(sum(samples)) / len(samples),
+                                       delta=1e-9 * scale)
+                self.assertAlmostEqual(history.window_deviation(lane_id), sample_deviation(samples),
+                                       delta=1e-6 * scale)
+
+    def test_window_of_one_step(self):
+        self.check_window(1, 5, 1.0, 1)
+
+    def test_window_of_seven_steps(self):
+        self.check_window(7, 10, 1.0, 2)
+
+    def test_window_of_twenty_steps(self):
+        self.check_window(20, 10, 1.0, 3)
+
+    def test_large_samples(self):
+        self.check_window(20, 10, 1000.0, 4)
+
+    def test_constant_samples(self):
+        clock = StepWindow(7)
+        history = RingHistory(self.LANES, clock, deviations=True)
+        for step in range(1, 40):
+            clock.append(step)
+            for lane_id in self.LANES:
+                history[lane_id][step] = 0.1
+            for lane_id in self.LANES:
+                # The clamped variance is never negative
+                self.assertTrue(0 <= history.window_deviation(lane_id) < 1e-6)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Reads the metadata of a small SUMO network file, and its cache.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+import network
+from network import NetworkMetadata, load_metadata, network_hash
+
+"""A junction with four approaches of one lane and two links each. """
+NET = """<?xml version="1.0"?>
+<net version="0.13">
+  <edge id=":tl0_0" function="internal"><lane id=":tl0_0_0" index="0" length="5.0"/></edge>
+  <edge id="N0" from="a" to="tl0"><lane id="N0_0" index="0" length="100.00"/></edge>
+  <edge id="S0" from="b" to="tl0"><lane id="S0_0" index="0" length="90.00"/></edge>
+  <edge id="E0" from="c" to="tl0"><lane id="E0_0" index="0" length="80.00"/></edge>
+  <edge id="W0" from="d" to="tl0"><lane id="W0_0" index="0" length="70.00"/></edge>
+  <edge id="out" from="tl0" to="e"><lane id="out_0" index="0" length="50.00"/></edge>
+  <tlLogic id="tl0" type="static" programID="0" offset="0">
+    <phase duration="31" state="GGGGrrrr"/><phase duration="4" state="yyyyrrrr"/>
+    <phase duration="31" state="rrrrGGGG"/><phase duration="4" state="rrrryyyy"/>
+  </tlLogic>
+  <connection from="N0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="0"/>
+  <connection from="N0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="1"/>
+  <connection from="S0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="2"/>
+  <connection from="S0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="3"/>
+  <connection from="W0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="7"/>
+  <connection from="E0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="4"/>
+  <connection from="E0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="5"/>
+  <connection from="W0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="6"/>
+</net>
+"""
+
+"""The same junction without the second link of the north approach, a gap in the indexes. """
+NET_WITH_GAP = NET.replace('''  <connection from="N0" to="out" fromLane="0" toLane="0" via=":tl0_0_0" tl="tl0" linkIndex="1"/>
+''', "")
+
+"""The same junction with a second program, loaded after the first one. """
+NET_WITH_PROGRAMS = NET.replace('''  <connection from="N0"''', '''  <tlLogic id="tl0" type="static" programID="long" offset="0">
+    <phase duration="41" state="GGGGrrrr"/><phase duration="4" state="yyyyrrrr"/>
+    <phase duration="21" state="rrrrGGGG"/><phase duration="4" state="rrrryyyy"/>
+  </tlLogic>
+  <connection from="N0"''', 1)
+
+class NetworkMetadataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.net_file = self.write_net(NET)
+        self.cache_dir = os.path.join(self.directory, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_net(self, text, name="test.net.xml"):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_lanes_follow_the_link_indexes(self):
+        tls = NetworkMetadata.from_net_file(self.net_file)["tl0"]
+        self.assertEqual(tls.lanes, ("N0_0", "N0_0", "S0_0", "S0_0", "E0_0", "E0_0", "W0_0", "W0_0"))
+        self.assertEqual(tls.lane_lengths["W0_0"], 70.0)
+        self.assertEqual([phase._duration for phase in tls.program._phases], [31000, 4000, 31000, 4000])
+
+    def test_gap_in_the_link_indexes_keeps_the_positions(self):
+        tls = NetworkMetadata.from_net_file(self.write_net(NET_WITH_GAP, "gap.net.xml"))["tl0"]
+        self.assertEqual(tls.lanes, ("N0_0", "", "S0_0", "S0_0", "E0_0", "E0_0", "W0_0", "W0_0"))
+        self.assertEqual(tls.links[1], [])
+        self.assertEqual(sorted(tls.lane_lengths), ["E0_0", "N0_0", "S0_0", "W0_0"])
+
+    def test_last_program_is_the_running_one(self):
+        tls = NetworkMetadata.from_net_file(self.write_net(NET_WITH_PROGRAMS, "programs.net.xml"))["tl0"]
+        self.assertEqual([program._subID for program in tls.programs], ["0", "long"])
+        self.assertEqual(tls.program_id, "long")
+        self.assertEqual([phase._duration for phase in tls.program._phases], [41000, 4000, 21000, 4000])
+
+    def test_cache_is_saved_and_loaded(self):
+        metadata = load_metadata(self.net_file, self.cache_dir)
+        path = os.path.join(self.cache_dir, network_hash(self.net_file) + ".pickle")
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(load_metadata(self.net_file, self.cache_dir)["tl0"].lanes, metadata["tl0"].lanes)
+
+    def test_cache_depends_on_the_format(self):
+        digest = network_hash(self.net_file)
+        format = network.METADATA_FORMAT
+        network.METADATA_FORMAT = format + 1
+        try:
+            self.assertNotEqual(network_hash(self.net_file), digest)
+        finally:
+            network.METADATA_FORMAT = format
+
+    def test_broken_cache_is_a_miss(self):
+        os.makedirs(self.cache_dir)
+        path = os.path.join(self.cache_dir, network_hash(self.net_file) + ".pickle")
+        # A class that no longer exists raises AttributeError, other data TypeError and so on
+        for data in ("cnetwork\nMissingMetadata\np0\n.", "cnetwork\nTrafficLightMetadata\n(tR.", "(lp0\n.", "garbage"):
+            with open(path, "wb") as f:
+                f.write(data)
+            self.assertEqual(load_metadata(self.net_file, self.cache_dir).ids, ["tl0"])
+            # The cache was written again with the data read from the network file
+            self.assertEqual(NetworkMetadata.load(path).ids, ["tl0"])
+
+if __name__ == "__main__":
+    unittest.main()
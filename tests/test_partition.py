@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Runs the partitioned control over a fake server and compares it with the serial control.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+import ant
+import partition
+from backend import traci
+from fake_traci import FakeTraci, FakeManager, FakeClient
+from network import NetworkMetadata
+from sensors import LaneSensor, SensorHub
+from actuators import BatchActuator
+from scheduler import Scheduler
+
+"""The steps of each execution, enough for the ants to act a few times. """
+STEPS = 800
+
+def create_sensor():
+    return SensorHub(LaneSensor())
+
+def create_agents(ids, sensor, actuator):
+    return [ant.Ant(id=id, memory_window=20, evaporation_rate=0.5, response_threshold=0.5,
+                    sensor=sensor, actuator=actuator)
+            for id in ids]
+
+def programs(domain, ids):
+    """The running program of each traffic light and the durations of its phases."""
+    data = dict()
+    for id in ids:
+        program_id = domain.getProgram(id)
+        logic = [logic for logic in domain.getCompleteRedYellowGreenDefinition(id) if logic._subID == program_id][0]
+        data[id] = (program_id, [phase._duration for phase in logic._phases])
+    return data
+
+class CoordinatorTest(unittest.TestCase):
+
+    def setUp(self):
+        # The ants take the last of the best plans, so their decisions do not
+        # depend on the random choices, that are seeded by partition
+        self.choice = ant.choice
+        ant.choice = lambda plans: plans[-1]
+        self.steps_limit = partition.STEPS_LIMIT
+        partition.STEPS_LIMIT = STEPS
+
+    def tearDown(self):
+        ant.choice = self.choice
+        partition.STEPS_LIMIT = self.steps_limit
+        traci.select(None)
+
+    def run_serial(self):
+        fake = FakeTraci()
+        traci.select(fake)
+        traci.init()
+        sensor = create_sensor()
+        actuator = BatchActuator(sensor)
+        agents = create_agents(traci.trafficlights.getIDList(), sensor, actuator)
+        scheduler = Scheduler(agents)
+        for step in range(1, STEPS + 1):
+            traci.simulationStep()
+            sensor.update()
+            scheduler.update(step)
+            actuator.flush()
+        traci.close()
+        return dict((agent.id, str(agent)) for agent in agents), programs(fake.trafficlights, fake.trafficlights.getIDList())
+
+    def test_two_partitions_decide_as_the_serial_control(self):
+        agents, decisions = self.run_serial()
+
+        traci.select(FakeTraci())
+        parts = partition.partition(NetworkMetadata.from_traci(), 2)
+        self.assertEqual(len(parts), 2)
+
+        manager = FakeManager()
+        manager.start()
+        try:
+            server = manager.FakeServer(len(parts))
+            def connect(index):
+                traci.select(FakeClient(server))
+                traci.init()
+                traci.setOrder(index + 1)
+
+            coordinator = partition.Coordinator(parts, connect, create_sensor, create_agents)
+            self.assertTrue(coordinator.run(), coordinator.error)
+
+            client = FakeClient(server)
+            ids = sorted(id for part in parts for id in part)
+            self.assertEqual(programs(client.trafficlights, ids), decisions)
+        finally:
+            manager.shutdown()
+
+        # Some ant changed its plan, so the decisions were compared
+        self.assertTrue(any(program_id != "0" for program_id, durations in decisions.values()))
+        partitioned = dict()
+        for index, statistics in enumerate(coordinator.statistics):
+            self.assertEqual(statistics["steps"], STEPS)
+            partitioned.update(zip(parts[index], statistics["agents"]))
+        self.assertEqual(partitioned, agents)
+
+if __name__ == "__main__":
+    unittest.main()
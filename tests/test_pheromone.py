@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Compares the running pheromone density of the ants with its definition.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from backend import traci
+from fake_traci import FakeTraci
+from sensors import LaneSensor, SensorHub
+from actuators import BatchActuator
+from ant import Ant
+
+def pheromone_density(ant, lane_id):
+    """The weighted average of the occupancies of the lane over the whole window, as first defined."""
+    num = den = 0
+    for w, occupancy in enumerate(ant.vehicular_occupancy.window(lane_id)):
+        evaporation = 1.0 / pow(ant.evaporation_rate, w)
+        num += evaporation * occupancy
+        den += evaporation
+    try:
+        return num / den
+    except ZeroDivisionError:
+        return 0
+
+class PheromoneDensityTest(unittest.TestCase):
+
+    def setUp(self):
+        traci.select(FakeTraci(size=2, seed=3))
+        traci.init()
+
+    def tearDown(self):
+        traci.close()
+        traci.select(None)
+
+    def check_window(self, memory_window, evaporation_rate, steps):
+        hub = SensorHub(LaneSensor())
+        actuator = BatchActuator(hub)
+        ants = [Ant(id=tls_id, memory_window=memory_window, evaporation_rate=evaporation_rate,
+                    response_threshold=0.5, sensor=hub, actuator=actuator)
+                for tls_id in traci.trafficlights.getIDList()]
+        turns = 0
+        zeros = 0
+        deposited = False
+        for step in range(1, steps + 1):
+            traci.simulationStep()
+            hub.update()
+            for ant in ants:
+                ant.update(step)
+                filling = len(ant.memory_window) < memory_window
+                for lane_id, row in ant.pheromone_rows.items():
+                    expected = pheromone_density(ant, lane_id)
+                    density = ant.pheromone_density[row]
+                    deposited = deposited or density > 0
+                    if filling:
+                        # The weights are added in the same order while the window fills
+                        self.assertEqual(density, expected)
+                    else:
+                        self.assertAlmostEqual(density, expected, delta=1e-12 * max(1, abs(expected)))
+                    if expected == 0:
+                        # Not the -0.0 or the negative rounding of the running sums
+                        self.assertEqual(repr(density), "0.0")
+                        zeros += 1
+            actuator.flush()
+            if ants[0].history_window.head == 0:
+                turns += 1
+        # The window was filled and turned many times
+        self.assertTrue(turns >= 3)
+        self.assertTrue(deposited)
+        self.assertTrue(zeros > 0)
+
+    def test_window_of_one_step(self):
+        self.check_window(1, 0.5, 60)
+
+    def test_window_of_seven_steps(self):
+        self.check_window(7, 0.5, 200)
+
+    def test_window_of_twenty_steps(self):
+        self.check_window(20, 0.5, 600)
+
+    def test_slow_evaporation(self):
+        self.check_window(20, 0.9, 300)
+
+    def test_window_of_thirty_seven_steps(self):
+        self.check_window(37, 0.5, 1500)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Records the agents over the fake network and replays them from the recording.
+"""
+
+import os
+import sys
+import gzip
+import shutil
+import struct
+import tempfile
+import unittest
+import cPickle as pickle
+from random import seed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from backend import traci
+from fake_traci import FakeTraci
+from sensors import LaneSensor, SensorHub
+from actuators import BatchActuator
+from learning_agent import LearningAgent
+from replay import RecordingBackend, ReplayBackend, ReplayDivergence, RECORDING_ERRORS
+
+"""The steps of each execution, enough for the agents to act a few times. """
+STEPS = 700
+
+def run_agents(module, steps=STEPS, random_seed=7):
+    """Runs the agents over the given backend, returns them."""
+    seed(random_seed)
+    traci.select(module)
+    traci.init()
+    hub = SensorHub(LaneSensor())
+    actuator = BatchActuator(hub)
+    agents = [LearningAgent(id=tls_id, memory_window=100, learning_rate=0.5, discount_factor=0.9,
+                            curiosity=1, curiosity_decay=0.1, exploration_period=30, qvalue=0,
+                            reward_exponent=2, memory_loss_factor=0.5, sensor=hub, actuator=actuator)
+              for tls_id in traci.trafficlights.getIDList()]
+    for step in range(1, steps + 1):
+        traci.simulationStep()
+        hub.update()
+        for agent in agents:
+            agent.update(step)
+        actuator.flush()
+    traci.close()
+    return [str(agent) for agent in agents]
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run.gz")
+
+    def tearDown(self):
+        traci.select(None)
+        shutil.rmtree(self.directory)
+
+    def record(self):
+        return run_agents(RecordingBackend(FakeTraci(size=2, seed=3), self.path, 7))
+
+    def test_replay_runs_as_recorded(self):
+        agents = self.record()
+        replay = ReplayBackend(self.path)
+        self.assertEqual(replay.seed, 7)
+        self.assertEqual(run_agents(replay), agents)
+        self.assertEqual(replay.step, STEPS)
+
+    def test_other_agents_diverge(self):
+        self.record()
+        # Other random choices push other programs
+        self.assertRaises(ReplayDivergence, run_agents, ReplayBackend(self.path), STEPS, 8)
+
+    def test_replay_after_the_recording_ends(self):
+        self.record()
+        self.assertRaises(ReplayDivergence, run_agents, ReplayBackend(self.path), STEPS + 1)
+
+    def test_truncated_recording(self):
+        self.record()
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for size in (0, 10, len(data) // 2):
+            with open(self.path, "wb") as f:
+                f.write(data[:size])
+            # The header may still be read, then the replay ends where the data does
+            try:
+                replay = ReplayBackend(self.path)
+            except RECORDING_ERRORS:
+                continue
+            self.assertRaises(ReplayDivergence, run_agents, replay)
+
+    def test_header_that_is_not_a_dict(self):
+        data = pickle.dumps([1], pickle.HIGHEST_PROTOCOL)
+        stream = gzip.open(self.path, "wb")
+        stream.write(struct.pack("<I", len(data)) + data)
+        stream.close()
+        self.assertRaises(ValueError, ReplayBackend, self.path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""Runs the agents through the scheduler and compares them with the per step loop.
+"""
+
+import os
+import sys
+import unittest
+from random import seed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from backend import traci
+from fake_traci import FakeTraci
+from sensors import LaneSensor, DetectorSensor, SensorHub
+from actuators import BatchActuator
+from learning_agent import LearningAgent
+from scheduler import Scheduler
+
+"""The steps of each execution, enough for the agents to act a few times. """
+STEPS = 1200
+
+class SchedulerTest(unittest.TestCase):
+
+    def tearDown(self):
+        traci.select(None)
+
+    def run_agents(self, sensor, scheduled):
+        """Runs the agents of the fake network, returns them and their scheduler."""
+        seed(5)
+        traci.select(FakeTraci(size=2, seed=2))
+        traci.init()
+        hub = SensorHub(sensor)
+        actuator = BatchActuator(hub)
+        agents = [LearningAgent(id=tls_id, memory_window=500, learning_rate=0.5, discount_factor=0.9,
+                                curiosity=1, curiosity_decay=0.1, exploration_period=30, qvalue=0,
+                                reward_exponent=2, memory_loss_factor=0.5, sensor=hub, actuator=actuator)
+                  for tls_id in traci.trafficlights.getIDList()]
+        scheduler = Scheduler(agents)
+        for step in range(1, STEPS + 1):
+            traci.simulationStep()
+            hub.update()
+            if scheduled:
+                scheduler.update(step)
+            else:
+                for agent in agents:
+                    agent.update(step)
+            actuator.flush()
+        traci.close()
+        return [str(agent) for agent in agents], scheduler
+
+    def test_idle_agents_are_skipped(self):
+        agents, scheduler = self.run_agents(DetectorSensor(), True)
+        self.assertTrue(scheduler.sleeping)
+        # The agents sleep until the end of each cycle
+        self.assertTrue(scheduler.skipped > 10 * scheduler.updates)
+        self.assertEqual(scheduler.updates + scheduler.skipped, 2 * STEPS)
+
+        reference, _ = self.run_agents(DetectorSensor(), False)
+        self.assertEqual(agents, reference)
+
+    def test_sampling_agents_bypass_the_queue(self):
+        agents, scheduler = self.run_agents(LaneSensor(), True)
+        self.assertFalse(scheduler.sleeping)
+        self.assertEqual(scheduler.updates, 2 * STEPS)
+        self.assertEqual(scheduler.skipped, 0)
+        self.assertEqual(len(scheduler.queue), 2)
+
+        reference, _ = self.run_agents(LaneSensor(), False)
+        self.assertEqual(agents, reference)
+
+if __name__ == "__main__":
+    unittest.main()